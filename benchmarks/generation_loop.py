@@ -0,0 +1,262 @@
+import argparse
+import itertools
+import json
+import logging
+import random
+import sys
+import time
+import tracemalloc
+import warnings
+
+import runner.__main__ as runner_main
+from database_handler.database_handler import DatabaseHandler
+from message_handler.message_handler import MessageHandler
+from population.population import Population, PopulationBuffer
+from runner.pga_run import PgaRun
+from utilities import metrics, utils
+from utilities.run_context import get_run_context, reset_run_context
+
+# Run with: python -m benchmarks.generation_loop [--generations 20] [--output results.json]
+# Drives run_pga end to end against in-process stand-ins of the database and messaging handlers,
+# a synthetic evaluator echoes every released individual with a slightly mutated solution and its fitness.
+# Compare two result files of the same sweep to spot regressions of the generation loop.
+
+POPULATION_SIZES = [100, 1000, 10000]
+SOLUTION_SIZES = [10, 100]
+ELITISM_RATES = [0.0, 0.1, 0.5]
+PHASES = ["store", "release", "wait", "sort", "select"]
+
+
+class InMemoryDatabaseHandler(DatabaseHandler):
+    def __init__(self, pga_id, properties):
+        self.pga_id = pga_id
+        self.items = {key: str(value).encode("utf-8") for key, value in properties.items()}
+        self.population = None
+        self.checkpoint = None
+        self.fitness = {}
+        self.history = []
+
+    def is_healthy(self):
+        return True
+
+    def close(self):
+        pass
+
+    def store_properties(self, properties_dict):
+        self.items.update({key: str(value).encode("utf-8") for key, value in properties_dict.items()})
+
+    def store_population(self, population, checkpoint=None):
+        # Keep a copy like the database would, the runner continues with its own population.
+        self.population = Population.from_columns(list(population.solutions), population.fitness.copy())
+        self.checkpoint = None if checkpoint is None else json.loads(json.dumps(checkpoint))
+
+    def store_population_chunks(self, population_chunks):
+        population = Population()
+        for chunk in population_chunks:
+            population = population + chunk
+        self.store_population(population)
+
+    def retrieve_checkpoint(self):
+        if self.checkpoint is None:
+            return None, None
+        return self.checkpoint, self.population
+
+    def store_summary(self, summary):
+        self.history.append(("{nr_}-0".format(nr_=self.history.__len__() + 1), json.loads(json.dumps(summary))))
+
+    def retrieve_history(self, after=None, count=None):
+        start = int(after.split("-")[0]) if after else 0
+        return self.history[start:start + count if count else None]
+
+    def clear_history(self):
+        self.history = []
+
+    def retrieve_item(self, property_name):
+        return self.items.get(property_name)
+
+    def retrieve_items(self, property_names):
+        return {name: self.items.get(name) for name in property_names}
+
+    def retrieve_list(self, property_name):
+        return []
+
+    def store_fitness(self, fitness_dict):
+        self.fitness.update(fitness_dict)
+
+    def retrieve_fitness(self, solution_keys):
+        return [self.fitness.get(key) for key in solution_keys]
+
+
+class SyntheticEvaluator(object):
+    # Stands in for the model and the fitness evaluation: mutates one gene per solution and scores it.
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+
+    def random_population(self, population_size, solution_size):
+        solutions = [[self.rng.uniform(-1.0, 1.0) for _ in range(solution_size)] for _ in range(population_size)]
+        return Population.from_columns(solutions, [self.fitness(solution) for solution in solutions])
+
+    def evaluate(self, population):
+        evaluated = PopulationBuffer()
+        for solution in population.solutions:
+            child = list(solution)
+            child[self.rng.randrange(child.__len__())] += self.rng.gauss(0.0, 0.1)
+            evaluated.add(child, self.fitness(child))
+        return evaluated
+
+    def fitness(self, solution):
+        return -sum(gene * gene for gene in solution)
+
+
+class LoopbackMessageHandler(MessageHandler):
+    # Evaluates released populations synchronously, so waiting for a generation never blocks.
+    # Message headers are passed on with the evaluated individuals, as the model and evaluation stages do.
+    def __init__(self, pga_id, evaluator, initial_population):
+        self.pga_id = pga_id
+        self.evaluator = evaluator
+        self.released = [(initial_population, {})]
+
+    def is_healthy(self):
+        return True
+
+    def close(self):
+        pass
+
+    def receive_messages(self, generation=None, quorum=1.0, deadline_seconds=None, late_arrivals=None,
+                         should_stop=None):
+        released = self.released
+        self.released = []
+        for population, _ in released:
+            individuals = population if generation == 0 else self.evaluator.evaluate(population)
+            utils.save_received_individuals(self.pga_id, individuals, 0)
+        return None
+
+    def acknowledge(self, receipt):
+        pass
+
+    def requeue(self, receipt):
+        pass
+
+    def receive_continuously(self, on_individuals, should_stop):
+        while self.released and not should_stop():
+            population, headers = self.released.pop(0)
+            if on_individuals(self.evaluator.evaluate(population), headers):
+                return
+
+    def send_message(self, individuals, next_recipient, headers=None):
+        self.released.append((individuals, headers or {}))
+
+
+def run_once(pga_id, properties, solution_size, seed):
+    evaluator = SyntheticEvaluator(seed)
+    database_handler = InMemoryDatabaseHandler(pga_id, properties)
+    message_handler = LoopbackMessageHandler(
+        pga_id,
+        evaluator,
+        evaluator.random_population(properties["POPULATION_SIZE"], solution_size),
+    )
+    runner_main.get_database_handler = lambda _: database_handler
+    runner_main.get_message_handler = lambda _: message_handler
+    reset_run_context(pga_id)
+    get_run_context(pga_id).container_conf = {
+        "pga_id": pga_id,
+        "source": "eval",
+        "init_gen": "init_gen",
+        "init_eval": "init_eval",
+        "pga": "model",
+    }
+
+    pga_run = PgaRun(pga_id)
+    start = time.perf_counter()
+    runner_main.run_pga(pga_id, pga_run)
+    return time.perf_counter() - start, pga_run.get_progress()
+
+
+def benchmark(pga_ids, population_size, solution_size, elitism_rate, generations, repeats, seed):
+    properties = {
+        "POPULATION_SIZE": population_size,
+        "ELITISM_RATE": elitism_rate,
+        "MAX_GENERATIONS": generations,
+        "MAX_UNIMPROVED_GENERATIONS": generations + 1,
+        "MAX_TIME_SECONDS": float("inf"),
+    }
+    utils.get_pga_config = lambda _: {"properties": properties}
+
+    # Timed runs first, peak memory is traced in a separate run since tracing slows down allocations.
+    timings = []
+    phase_seconds = {phase: 0.0 for phase in PHASES}
+    generations_done = 0
+    for _ in range(repeats):
+        pga_id = next(pga_ids)
+        elapsed, progress = run_once(pga_id, properties, solution_size, seed)
+        timings.append(elapsed)
+        generations_done += progress.get("generations_done", 0)
+        for phase, (_, total) in metrics.get_phase_seconds(pga_id).items():
+            phase_seconds[phase] = phase_seconds.get(phase, 0.0) + total
+
+    tracemalloc.start()
+    run_once(next(pga_ids), properties, solution_size, seed)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total_time = sum(timings)
+    return {
+        "population_size": population_size,
+        "solution_size": solution_size,
+        "elitism_rate": elitism_rate,
+        "generations": generations_done // repeats,
+        "seconds": {"min": min(timings), "mean": total_time / repeats, "max": max(timings)},
+        "individuals_per_second": generations_done * population_size / total_time if total_time > 0 else None,
+        "phase_ms_per_generation": {
+            phase: 1000 * seconds / generations_done if generations_done > 0 else None
+            for phase, seconds in phase_seconds.items()
+        },
+        "peak_memory_bytes": peak_memory,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the generation loop of run_pga end to end.")
+    parser.add_argument("--population-sizes", type=int, nargs="+", default=POPULATION_SIZES)
+    parser.add_argument("--solution-sizes", type=int, nargs="+", default=SOLUTION_SIZES)
+    parser.add_argument("--elitism-rates", type=float, nargs="+", default=ELITISM_RATES)
+    parser.add_argument("--generations", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="JSON result file, printed to stdout if omitted")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    warnings.simplefilter("ignore")
+
+    pga_ids = itertools.count(1)
+    results = []
+    for population_size, solution_size, elitism_rate in itertools.product(
+            args.population_sizes, args.solution_sizes, args.elitism_rates):
+        result = benchmark(pga_ids, population_size, solution_size, elitism_rate,
+                           args.generations, args.repeats, args.seed)
+        print("population {pop_:>6}, solution {sol_:>4}, elitism {eli_:.2f}: {ips_:>12,.0f} individuals/s".format(
+            pop_=population_size,
+            sol_=solution_size,
+            eli_=elitism_rate,
+            ips_=result["individuals_per_second"] or 0,
+        ), file=sys.stderr)
+        results.append(result)
+
+    report = {
+        "benchmark": "generation_loop",
+        "python": sys.version.split()[0],
+        "generations": args.generations,
+        "repeats": args.repeats,
+        "seed": args.seed,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, mode="w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
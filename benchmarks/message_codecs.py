@@ -0,0 +1,56 @@
+import argparse
+import random
+import time
+
+from population import codecs
+from population.population import Population
+
+# Run with: python -m benchmarks.message_codecs [--size 10000] [--solution-length 100]
+
+CODEC_NAMES = ["json", "msgpack", "struct"]
+
+
+def build_population(size, solution_length, numeric):
+    rng = random.Random(0)
+    if numeric:
+        solutions = [[rng.random() for _ in range(solution_length)] for _ in range(size)]
+    else:
+        solutions = ["".join(rng.choice("01") for _ in range(solution_length)) for _ in range(size)]
+    return Population.from_columns(solutions, [rng.random() for _ in range(size)])
+
+
+def measure(codec, population, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        body = codec.encode(population)
+    encode_time = (time.perf_counter() - start) / repeats
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        codec.decode_individuals(body)
+    decode_time = (time.perf_counter() - start) / repeats
+    return encode_time, decode_time, body.__len__()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the message codecs on a full population.")
+    parser.add_argument("--size", type=int, default=10000, help="individuals per population")
+    parser.add_argument("--solution-length", type=int, default=100, help="genes per solution")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    for numeric in [False, True]:
+        population = build_population(args.size, args.solution_length, numeric)
+        print("{kind_} solutions, {size_} individuals:".format(
+            kind_="numeric list" if numeric else "text",
+            size_=args.size,
+        ))
+        print("{:>10} {:>14} {:>14} {:>14}".format("codec", "encode [ms]", "decode [ms]", "size [kB]"))
+        for name in CODEC_NAMES:
+            encode_time, decode_time, size = measure(codecs.get_codec(name), population, args.repeats)
+            print("{:>10} {:>14.2f} {:>14.2f} {:>14.1f}".format(
+                name, encode_time * 1000, decode_time * 1000, size / 1024))
+
+
+if __name__ == "__main__":
+    main()
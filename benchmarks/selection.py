@@ -0,0 +1,115 @@
+import argparse
+import heapq
+import itertools
+import operator
+import random
+import time
+
+import numpy
+
+from population import selection
+from population.population import Population
+
+# Run with: python -m benchmarks.selection [--sizes 1000 10000 100000] [--elitism-rate 0.1]
+# Compares survivor selection on a sorted elite and sorted offspring against sorting everything anew,
+# which is what the generation loop did before on lists of individuals, and times every selection strategy.
+# The heap based top-k selections lost against the merge and are kept here only to compare with.
+# "as sorted" tells whether a method selected the same survivors as sorting everything.
+
+SIZES = [1000, 10000, 100000]
+
+
+def build_population(size, rng):
+    solutions = [[rng.random() for _ in range(4)] for _ in range(size)]
+    return Population.from_columns(solutions, [rng.random() for _ in range(size)]).sorted()
+
+
+def top_k(population, k):
+    # Returns the k fittest individuals, fittest first, keeping a heap of k candidates in O(n log k).
+    if k <= 0:
+        return Population()
+    if k >= population.__len__():
+        return population.sorted()
+    fitness = population.fitness.tolist()
+    # Negated indices make earlier individuals win ties, as with the stable sort.
+    best = heapq.nlargest(k, zip(fitness, range(0, -fitness.__len__(), -1)))
+    return population.take(numpy.array([-index for _, index in best], dtype=numpy.intp))
+
+
+def merge_top_k(k, *runs):
+    # Returns the k fittest individuals of populations that are each sorted by fitness, fittest first.
+    # Only the heads of the runs are merged, in O(k log r) for r runs.
+    heads = heapq.merge(
+        *[zip((-f for f in run.fitness.tolist()), itertools.count(), itertools.repeat(run_id))
+          for run_id, run in enumerate(runs)],
+        key=lambda entry: entry[0],
+    )
+    solutions = []
+    fitness = []
+    for negated_fitness, index, run_id in heads:
+        if solutions.__len__() >= k:
+            break
+        solutions.append(runs[run_id].solutions[index])
+        fitness.append(-negated_fitness)
+    return Population.from_columns(solutions, fitness)
+
+
+def sort_all_individuals(elite, offspring, size):
+    # The selection of the generation loop before: sorting elite and offspring anew as lists of individuals,
+    # then cutting off the tail.
+    return sorted(elite + offspring, key=operator.attrgetter("fitness"), reverse=True)[:size]
+
+
+def get_fitness(survivors):
+    if isinstance(survivors, Population):
+        return survivors.fitness.tolist()
+    return [individual.fitness for individual in survivors]
+
+
+def measure(select, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        survivors = select()
+    return (time.perf_counter() - start) / repeats, survivors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark survivor selection on sorted populations.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="individuals per population")
+    parser.add_argument("--elitism-rate", type=float, default=0.1)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        rng = random.Random(0)
+        parents = build_population(size, rng)
+        elite = parents.elite(max(1, int(size * args.elitism_rate)))
+        offspring = build_population(size, rng)
+        elite_individuals = list(elite)
+        offspring_individuals = list(offspring)
+
+        methods = [
+            ("sort list", lambda: sort_all_individuals(elite_individuals, offspring_individuals, size)),
+            ("sort all", lambda: (elite + offspring).sorted()[:size]),
+            ("merge", lambda: selection.merge_sorted(elite, offspring)[:size]),
+            ("merge top k", lambda: merge_top_k(size, elite, offspring)),
+            ("heap top k", lambda: top_k(elite + offspring, size)),
+            ("partition", lambda: (elite + offspring).top_k(size)),
+        ]
+        for strategy in [selection.TRUNCATION, selection.MU_PLUS_LAMBDA, selection.MU_COMMA_LAMBDA,
+                         selection.TOURNAMENT, selection.DIVERSE_TRUNCATION]:
+            methods.append((strategy, lambda strategy=strategy: selection.select_survivors(
+                strategy, parents, elite, offspring, size, random.Random(0))))
+
+        print("{size_} individuals, {elite_} elite:".format(size_=size, elite_=elite.__len__()))
+        print("{:>12} {:>14} {:>10}".format("method", "select [ms]", "as sorted"))
+        expected = None
+        for name, select in methods:
+            seconds, survivors = measure(select, args.repeats)
+            if expected is None:
+                expected = get_fitness(survivors)
+            print("{:>12} {:>14.2f} {:>10}".format(name, seconds * 1000, str(get_fitness(survivors) == expected)))
+
+
+if __name__ == "__main__":
+    main()
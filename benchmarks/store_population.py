@@ -0,0 +1,110 @@
+import argparse
+import json
+import time
+
+import redis
+
+from database_handler.redis_handler import RedisHandler
+from population.individual import Individual, IndividualEncoder
+
+# Run with: python -m benchmarks.store_population [--host redis--1] [--rtt 0.0002]
+# Without a host, an in-process stand-in counts round trips and simulates the network latency per round trip.
+
+POPULATION_SIZES = [1000, 10000, 50000]
+
+
+class RoundTripCounter(object):
+    def __init__(self, rtt):
+        self.rtt = rtt
+        self.round_trips = 0
+        self.lists = {}
+
+    def round_trip(self):
+        self.round_trips += 1
+        if self.rtt > 0:
+            time.sleep(self.rtt)
+
+    # Redis commands used by the runner, each costing one round trip.
+    def delete(self, *keys):
+        self.round_trip()
+        self._delete(*keys)
+
+    def lpush(self, key, *values):
+        self.round_trip()
+        self._lpush(key, *values)
+
+    def pipeline(self, transaction=True):
+        return _CountingPipeline(self)
+
+    # Command implementations without network cost.
+    def _delete(self, *keys):
+        for key in keys:
+            self.lists.pop(key, None)
+
+    def _lpush(self, key, *values):
+        self.lists.setdefault(key, [])[0:0] = reversed(values)
+
+    def _rpush(self, key, *values):
+        self.lists.setdefault(key, []).extend(values)
+
+    def _rename(self, source, destination):
+        self.lists[destination] = self.lists.pop(source)
+
+
+class _CountingPipeline(object):
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue_command(*args):
+            self.commands.append((getattr(self.client, "_" + name), args))
+        return queue_command
+
+    def execute(self):
+        self.client.round_trip()
+        for command, args in self.commands:
+            command(*args)
+        self.commands = []
+
+
+def store_population_per_individual(client, population):
+    # Former write path: one DELETE and one LPUSH round trip per individual.
+    client.delete("population")
+    for individual in population:
+        client.lpush("population", json.dumps(individual, cls=IndividualEncoder))
+
+
+def measure(client, store, population):
+    round_trips_before = getattr(client, "round_trips", 0)
+    start = time.perf_counter()
+    store(population)
+    elapsed = time.perf_counter() - start
+    round_trips = getattr(client, "round_trips", 0) - round_trips_before
+    return elapsed, round_trips
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark storing a population per generation.")
+    parser.add_argument("--host", default=None, help="redis host, uses an in-process stand-in if omitted")
+    parser.add_argument("--rtt", type=float, default=0.0002, help="simulated round trip time in seconds")
+    args = parser.parse_args()
+
+    if args.host:
+        client = redis.Redis(host=args.host)
+    else:
+        client = RoundTripCounter(args.rtt)
+    handler = RedisHandler.__new__(RedisHandler)
+    handler.redis = client
+
+    print("{:>12} {:>22} {:>14} {:>22} {:>14}".format(
+        "population", "per-individual [s]", "round trips", "pipelined [s]", "round trips"))
+    for size in POPULATION_SIZES:
+        population = [Individual("solution-{}".format(i), float(i)) for i in range(size)]
+        old_time, old_trips = measure(client, lambda pop: store_population_per_individual(client, pop), population)
+        new_time, new_trips = measure(client, handler.store_population, population)
+        print("{:>12} {:>22.4f} {:>14} {:>22.4f} {:>14}".format(size, old_time, old_trips, new_time, new_trips))
+
+
+if __name__ == "__main__":
+    main()
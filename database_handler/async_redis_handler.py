@@ -0,0 +1,95 @@
+import json
+import logging
+
+import redis
+import redis.asyncio
+from redis.backoff import ExponentialBackoff
+from redis.asyncio.retry import Retry
+
+from database_handler.database_handler import DatabaseHandler
+from database_handler.redis_handler import FITNESS_CACHE_KEY, HEALTH_CHECK_INTERVAL, RECONNECT_ATTEMPTS, HISTORY_KEY, \
+    HISTORY_MAX_LENGTH, encode_population, get_host, history_start, parse_checkpoint, parse_history, queue_properties, \
+    queue_push, queue_retrieve_checkpoint, queue_store_population, queue_swap_in
+
+
+class AsyncRedisHandler(DatabaseHandler):
+    # Coroutine counterpart of the RedisHandler for the asyncio runtime, queuing the same commands on its pipelines.
+    # Bound to the event loop it is first used on.
+    def __init__(self, pga_id):
+        self.connection_pool = redis.asyncio.ConnectionPool(
+            host=get_host(pga_id),
+            health_check_interval=HEALTH_CHECK_INTERVAL,
+            socket_keepalive=True,
+            retry=Retry(ExponentialBackoff(), RECONNECT_ATTEMPTS),
+            retry_on_error=[redis.exceptions.ConnectionError, redis.exceptions.TimeoutError],
+        )
+        self.redis = redis.asyncio.Redis(connection_pool=self.connection_pool)
+
+    async def is_healthy(self):
+        try:
+            return await self.redis.ping()
+        except redis.exceptions.ConnectionError:
+            return False
+
+    async def close(self):
+        await self.redis.aclose()
+        await self.connection_pool.disconnect()
+
+    async def store_properties(self, properties_dict):
+        pipeline = self.redis.pipeline(transaction=False)
+        queue_properties(pipeline, properties_dict)
+        await pipeline.execute()
+
+    async def store_population(self, population, checkpoint=None):
+        logging.info("redis: Storing population.")
+        pipeline = self.redis.pipeline(transaction=True)
+        queue_store_population(pipeline, "population", population, checkpoint)
+        await pipeline.execute()
+
+    async def store_population_chunks(self, population_chunks):
+        logging.info("redis: Storing population in chunks.")
+        temp_key = "population:writing"
+        await self.redis.delete(temp_key)
+        stored = 0
+        for population in population_chunks:
+            pipeline = self.redis.pipeline(transaction=False)
+            serialized = encode_population(population)
+            queue_push(pipeline, temp_key, serialized)
+            await pipeline.execute()
+            stored += serialized.__len__()
+
+        pipeline = self.redis.pipeline(transaction=True)
+        queue_swap_in(pipeline, temp_key, "population", stored)
+        await pipeline.execute()
+
+    async def retrieve_checkpoint(self):
+        pipeline = self.redis.pipeline(transaction=True)
+        queue_retrieve_checkpoint(pipeline)
+        return parse_checkpoint(*await pipeline.execute())
+
+    async def store_summary(self, summary):
+        await self.redis.xadd(
+            HISTORY_KEY, {"summary": json.dumps(summary)}, maxlen=HISTORY_MAX_LENGTH, approximate=True)
+
+    async def retrieve_history(self, after=None, count=None):
+        return parse_history(await self.redis.xrange(HISTORY_KEY, min=history_start(after), count=count))
+
+    async def clear_history(self):
+        await self.redis.delete(HISTORY_KEY)
+
+    async def retrieve_item(self, property_name):
+        return await self.redis.get(property_name)
+
+    async def retrieve_items(self, property_names):
+        return dict(zip(property_names, await self.redis.mget(property_names)))
+
+    async def retrieve_list(self, property_name):
+        return await self.redis.lrange(property_name, 0, -1)
+
+    async def store_fitness(self, fitness_dict):
+        await self.redis.hset(FITNESS_CACHE_KEY, mapping=fitness_dict)
+
+    async def retrieve_fitness(self, solution_keys):
+        if not solution_keys:
+            return []
+        return await self.redis.hmget(FITNESS_CACHE_KEY, solution_keys)
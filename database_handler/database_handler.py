@@ -7,18 +7,70 @@ class DatabaseHandler(ABC):
         # pga_id required to identify the specific database service
         pass
 
+    @abstractmethod
+    def is_healthy(self):
+        pass
+
+    @abstractmethod
+    def close(self):
+        # releases all connections to the database service
+        pass
+
     @abstractmethod
     def store_properties(self, properties_list):
         pass
 
     @abstractmethod
-    def store_population(self, population):
+    def store_population(self, population, checkpoint=None):
+        # checkpoint is a JSON serializable dict of run state stored atomically along with the population,
+        # storing a population without checkpoint clears the checkpoint of an earlier population
+        pass
+
+    @abstractmethod
+    def store_population_chunks(self, population_chunks):
+        # population_chunks is an iterable of populations, stored as one population without holding all chunks,
+        # clearing the checkpoint of an earlier population
+        pass
+
+    @abstractmethod
+    def retrieve_checkpoint(self):
+        # returns the last checkpoint and its population, or (None, None) if there is none
+        pass
+
+    @abstractmethod
+    def store_summary(self, summary):
+        # summary is a JSON serializable dict of a finished generation, appended to the convergence history
+        pass
+
+    @abstractmethod
+    def retrieve_history(self, after=None, count=None):
+        # returns up to count (entry id, summary) pairs of the history in order, starting behind entry id after
+        pass
+
+    @abstractmethod
+    def clear_history(self):
+        # removes the convergence history of an earlier run
         pass
 
     @abstractmethod
     def retrieve_item(self, property_name):
         pass
 
+    @abstractmethod
+    def retrieve_items(self, property_names):
+        # returns a dict of the raw values of all given properties, fetched at once
+        pass
+
     @abstractmethod
     def retrieve_list(self, property_name):
         pass
+
+    @abstractmethod
+    def store_fitness(self, fitness_dict):
+        # fitness_dict maps solution hashes to their fitness
+        pass
+
+    @abstractmethod
+    def retrieve_fitness(self, solution_keys):
+        # returns the fitness of each solution hash, None if unknown
+        pass
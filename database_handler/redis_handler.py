@@ -2,40 +2,207 @@ import json
 import logging
 
 import redis
+from redis.backoff import ExponentialBackoff, NoBackoff
+from redis.retry import Retry
 
 from database_handler.database_handler import DatabaseHandler
 from population.individual import IndividualEncoder
+from population.population import Population
+
+# Amount of individuals pushed to redis per pipelined RPUSH command.
+STORE_CHUNK_SIZE = 1000
+# Hash mapping solution hashes to their fitness, shared by all components of the PGA.
+FITNESS_CACHE_KEY = "fitness_cache"
+# Seconds after which idle pooled connections are checked before being used again.
+HEALTH_CHECK_INTERVAL = 30
+# Attempts to reconnect and retry a command after losing the connection.
+RECONNECT_ATTEMPTS = 5
+# Seconds a health probe waits for a connection, it is attempted once.
+PROBE_TIMEOUT_SECONDS = 2
+# Run state belonging to the stored population, written in the same transaction as the population.
+CHECKPOINT_KEY = "checkpoint"
+# Stream of the generation summaries of the PGA, trimmed to about the given amount of latest entries.
+HISTORY_KEY = "history"
+HISTORY_MAX_LENGTH = 100000
+
+
+def get_host(pga_id):
+    return "redis--{id_}".format(id_=pga_id)
+
+
+# Commands and encodings shared with the AsyncRedisHandler, commands are queued on a pipeline of either client.
+def queue_properties(pipeline, properties_dict):
+    for prop_key, value in properties_dict.items():
+        if not type(value) in [str, int, list]:
+            value = str(value)
+        logging.info("redis: Storing property '{prop_}'={val_}".format(
+            prop_=prop_key,
+            val_=value,
+        ))
+        if type(value) is list:
+            if value.__len__() > 0:
+                pipeline.lpush(prop_key, *value)
+        else:
+            pipeline.set(prop_key, value)
+
+
+def encode_population(population):
+    return [json.dumps(individual, cls=IndividualEncoder) for individual in population]
+
+
+def queue_push(pipeline, key, serialized):
+    # Appends the serialized individuals with chunked RPUSH commands.
+    for start in range(0, serialized.__len__(), STORE_CHUNK_SIZE):
+        pipeline.rpush(key, *serialized[start:start + STORE_CHUNK_SIZE])
+
+
+def queue_swap_in(pipeline, temp_key, key, stored, checkpoint=None):
+    # RENAME swaps the written list in atomically, so readers never see a half-written population.
+    # The checkpoint is stored along with the population, a population stored without checkpoint clears
+    # the checkpoint of an earlier population.
+    if stored > 0:
+        pipeline.rename(temp_key, key)
+    else:
+        # RENAME fails on a missing source key, an empty population simply clears the list.
+        pipeline.delete(key)
+    if checkpoint is not None:
+        pipeline.set(CHECKPOINT_KEY, json.dumps(checkpoint))
+    else:
+        pipeline.delete(CHECKPOINT_KEY)
+
+
+def queue_store_population(pipeline, key, population, checkpoint=None):
+    # Writes the population into a temporary key and swaps it in, to be executed as one transaction.
+    temp_key = "{key_}:writing".format(key_=key)
+    serialized = encode_population(population)
+    pipeline.delete(temp_key)
+    queue_push(pipeline, temp_key, serialized)
+    queue_swap_in(pipeline, temp_key, key, serialized.__len__(), checkpoint)
+
+
+def queue_retrieve_checkpoint(pipeline):
+    # Read checkpoint and population within one transaction, so both belong to the same generation.
+    pipeline.get(CHECKPOINT_KEY)
+    pipeline.lrange("population", 0, -1)
+
+
+def parse_checkpoint(checkpoint, serialized_population):
+    # Returns the checkpoint and its population read by queue_retrieve_checkpoint, None for both without checkpoint.
+    if checkpoint is None:
+        return None, None
+    solutions = []
+    fitness = []
+    for serialized_individual in serialized_population:
+        ind_dict = json.loads(serialized_individual)
+        solutions.append(ind_dict["solution"])
+        fitness.append(ind_dict["fitness"])
+    return json.loads(checkpoint), Population.from_columns(solutions, fitness)
+
+
+def history_start(after=None):
+    # Stream entry ids grow with every entry, an exclusive range behind the last id read continues the history.
+    return "({id_}".format(id_=after) if after else "-"
+
+
+def parse_history(entries):
+    return [(entry_id.decode("utf-8"), json.loads(fields[b"summary"])) for entry_id, fields in entries]
+
+
+def probe(pga_id):
+    # Checks whether the database of a PGA answers with a single attempt, without creating a handler.
+    client = redis.Redis(
+        host=get_host(pga_id),
+        socket_connect_timeout=PROBE_TIMEOUT_SECONDS,
+        socket_timeout=PROBE_TIMEOUT_SECONDS,
+        retry=Retry(NoBackoff(), 0),
+    )
+    try:
+        return client.ping()
+    except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+        return False
+    finally:
+        client.close()
 
 
 class RedisHandler(DatabaseHandler):
     def __init__(self, pga_id):
-        self.redis = redis.Redis(host="redis--{id_}".format(id_=pga_id))
+        # The client draws from a thread-safe connection pool, checking the health of idle connections before use
+        # and reconnecting with backoff when a connection is lost.
+        self.connection_pool = redis.ConnectionPool(
+            host=get_host(pga_id),
+            health_check_interval=HEALTH_CHECK_INTERVAL,
+            socket_keepalive=True,
+            retry=Retry(ExponentialBackoff(), RECONNECT_ATTEMPTS),
+            retry_on_error=[redis.exceptions.ConnectionError, redis.exceptions.TimeoutError],
+        )
+        self.redis = redis.Redis(connection_pool=self.connection_pool)
+
+    def is_healthy(self):
+        try:
+            return self.redis.ping()
+        except redis.exceptions.ConnectionError:
+            return False
+
+    def close(self):
+        self.connection_pool.disconnect()
 
     def store_properties(self, properties_dict):
-        prop_keys = [*properties_dict]
-        for prop_key in prop_keys:
-            value = properties_dict[prop_key]
-            if not type(value) in [str, int, list]:
-                value = str(value)
-            logging.info("redis: Storing property '{prop_}'={val_}".format(
-                prop_=prop_key,
-                val_=value,
-            ))
-            if type(value) is list:
-                for val in value:
-                    self.redis.lpush(prop_key, val)
-            else:
-                self.redis.set(prop_key, value)
-
-    def store_population(self, population):
+        # Store all properties with a single pipelined round trip.
+        pipeline = self.redis.pipeline(transaction=False)
+        queue_properties(pipeline, properties_dict)
+        pipeline.execute()
+
+    def store_population(self, population, checkpoint=None):
         logging.info("redis: Storing population.")
-        self.redis.delete("population")
-        for individual in population:
-            serialized_individual = json.dumps(individual, cls=IndividualEncoder)
-            self.redis.lpush("population", serialized_individual)
+        pipeline = self.redis.pipeline(transaction=True)
+        queue_store_population(pipeline, "population", population, checkpoint)
+        pipeline.execute()
+
+    def store_population_chunks(self, population_chunks):
+        # Writes chunk by chunk into the temporary key, only the final RENAME replaces the stored population,
+        # in one transaction clearing the checkpoint of an earlier population.
+        logging.info("redis: Storing population in chunks.")
+        temp_key = "population:writing"
+        self.redis.delete(temp_key)
+        stored = 0
+        for population in population_chunks:
+            pipeline = self.redis.pipeline(transaction=False)
+            serialized = encode_population(population)
+            queue_push(pipeline, temp_key, serialized)
+            pipeline.execute()
+            stored += serialized.__len__()
+
+        pipeline = self.redis.pipeline(transaction=True)
+        queue_swap_in(pipeline, temp_key, "population", stored)
+        pipeline.execute()
+
+    def retrieve_checkpoint(self):
+        pipeline = self.redis.pipeline(transaction=True)
+        queue_retrieve_checkpoint(pipeline)
+        return parse_checkpoint(*pipeline.execute())
+
+    def store_summary(self, summary):
+        self.redis.xadd(HISTORY_KEY, {"summary": json.dumps(summary)}, maxlen=HISTORY_MAX_LENGTH, approximate=True)
+
+    def retrieve_history(self, after=None, count=None):
+        return parse_history(self.redis.xrange(HISTORY_KEY, min=history_start(after), count=count))
+
+    def clear_history(self):
+        self.redis.delete(HISTORY_KEY)
 
     def retrieve_item(self, property_name):
         return self.redis.get(property_name)
 
+    def retrieve_items(self, property_names):
+        return dict(zip(property_names, self.redis.mget(property_names)))
+
     def retrieve_list(self, property_name):
         return self.redis.lrange(property_name, 0, -1)
+
+    def store_fitness(self, fitness_dict):
+        self.redis.hset(FITNESS_CACHE_KEY, mapping=fitness_dict)
+
+    def retrieve_fitness(self, solution_keys):
+        if not solution_keys:
+            return []
+        return self.redis.hmget(FITNESS_CACHE_KEY, solution_keys)
@@ -0,0 +1,85 @@
+import collections
+import logging
+import threading
+
+from utilities import metrics
+
+# Snapshots waiting to be persisted, older ones are superseded by newer ones once the queue is full.
+DEFAULT_QUEUE_SIZE = 1
+
+
+class WriteBehindPersister(object):
+    # Persists population snapshots on a background thread, so storing a generation overlaps with releasing
+    # the next one. Only the latest of several waiting snapshots is written, superseded ones are skipped.
+    # Offers store_population like the database handler it writes to, close waits until all is written.
+    # The on_persisted callbacks of a snapshot and of the snapshots it superseded run once it is written.
+    def __init__(self, pga_id, database_handler, queue_size=DEFAULT_QUEUE_SIZE):
+        self.pga_id = pga_id
+        self.database_handler = database_handler
+        self.snapshots = collections.deque(maxlen=max(1, queue_size))
+        self.condition = threading.Condition()
+        self.closed = False
+        self.error = None
+        self.thread = threading.Thread(
+            target=self.__persist_snapshots,
+            name="persister-{id_}".format(id_=pga_id),
+            daemon=True,
+        )
+        self.thread.start()
+
+    def store_population(self, population, checkpoint=None, on_persisted=None):
+        # Populations are not modified once built, so the snapshot can be queued without copying it.
+        callbacks = [] if on_persisted is None else [on_persisted]
+        with self.condition:
+            self.__raise_error()
+            if self.closed:
+                raise Exception("Persister of PGA {id_} is closed already!".format(id_=self.pga_id))
+            if self.snapshots.__len__() == self.snapshots.maxlen:
+                metrics.inc("pga_coalesced_snapshots_total", self.pga_id)
+                _, _, superseded_callbacks = self.snapshots.popleft()
+                callbacks = superseded_callbacks + callbacks
+            self.snapshots.append((population, checkpoint, callbacks))
+            self.condition.notify_all()
+
+    def store_summary(self, summary):
+        # Summaries are small and never superseded by later ones, they are appended right away.
+        self.database_handler.store_summary(summary)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+        self.__raise_error()
+
+    def __raise_error(self):
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise error
+
+    def __persist_snapshots(self):
+        while True:
+            with self.condition:
+                while not self.snapshots and not self.closed:
+                    self.condition.wait()
+                if not self.snapshots:
+                    return
+
+                # Take the latest snapshot, all earlier ones are superseded by it.
+                population, checkpoint, callbacks = self.snapshots.pop()
+                coalesced = self.snapshots.__len__()
+                callbacks = [callback for _, _, superseded_callbacks in self.snapshots
+                             for callback in superseded_callbacks] + callbacks
+                self.snapshots.clear()
+            if coalesced > 0:
+                metrics.inc("pga_coalesced_snapshots_total", self.pga_id, coalesced)
+
+            try:
+                with metrics.span(self.pga_id, "persist"):
+                    self.database_handler.store_population(population, checkpoint=checkpoint)
+                for callback in callbacks:
+                    callback()
+            except Exception as e:
+                logging.exception("Persisting the population of PGA {id_} failed.".format(id_=self.pga_id))
+                self.error = e
@@ -0,0 +1,225 @@
+import asyncio
+import json
+import logging
+import math
+
+import aio_pika
+
+from message_handler.message_handler import MessageHandler, GenerationCollector, SHARD_HEADER, SHARD_COUNT_HEADER, \
+    LATE_ARRIVALS_RECYCLE
+from message_handler.rabbit_message_queue import DEFAULT_PREFETCH_COUNT, CONSUME_POLL_SECONDS, HEARTBEAT_SECONDS, \
+    split_into_shards
+from population import codecs
+from utilities import metrics, utils
+
+# Errors settling received messages on a lost channel, whose messages the broker requeued already.
+SETTLE_ERRORS = (aio_pika.exceptions.AMQPError, aio_pika.exceptions.ChannelInvalidStateError)
+
+
+class AsyncRabbitMessageQueue(MessageHandler):
+    # Coroutine counterpart of the RabbitMessageQueue for the asyncio runtime.
+    # The robust connection re-establishes itself, its channel and consumers after connection failures.
+    # Publishes wait for their broker confirm, but run concurrently, so many publishes share one round trip.
+    # Bound to the event loop it is first used on.
+    def __init__(self, pga_id):
+        self.pga_id = pga_id
+        self.connection = None
+        self.channel = None
+        self.declared_queues = {}
+        self.lock = asyncio.Lock()
+
+    async def is_healthy(self):
+        return self.connection is not None and not self.connection.is_closed
+
+    async def close(self):
+        if self.connection is not None and not self.connection.is_closed:
+            await self.connection.close()
+        self.connection = None
+        self.channel = None
+        self.declared_queues = {}
+
+    async def receive_messages(self, generation=None, quorum=1.0, deadline_seconds=None,
+                               late_arrivals=LATE_ARRIVALS_RECYCLE, should_stop=None):
+        queue_name = utils.get_messaging_source(self.pga_id)
+        collector = GenerationCollector(
+            pga_id=self.pga_id,
+            source="rMQ:{queue_}".format(queue_=queue_name),
+            generation=generation,
+            quorum=quorum,
+            deadline_seconds=deadline_seconds,
+            late_arrivals=late_arrivals,
+            should_stop=should_stop,
+        )
+        logging.info("rMQ:{queue_}: Waiting for generation individuals feedback.".format(queue_=queue_name))
+
+        # The messages are acknowledged once the generation is persisted, so the prefetch window has to hold
+        # those of the generation being persisted and those of the generation being received.
+        prefetch_count = max(
+            utils.get_property(self.pga_id, "RECEIVE_PREFETCH", DEFAULT_PREFETCH_COUNT),
+            2 * collector.population_size,
+        )
+        receipt = await self.__consume(queue_name, collector.on_individuals, collector.stop_waiting,
+                                       prefetch_count=prefetch_count, defer_ack=True)
+        collector.finish()
+        return receipt
+
+    async def acknowledge(self, receipt):
+        # The receipt lists the messages received, acknowledging the last one acknowledges all messages before,
+        # those of earlier generations are acknowledged already. After a reconnect there is nothing to acknowledge,
+        # the broker requeued the messages with the lost channel.
+        if receipt:
+            await self.__settle([receipt[-1].ack(multiple=True)])
+
+    async def requeue(self, receipt):
+        # Rejects each message on its own, those of the generation still being persisted are left.
+        if receipt:
+            await self.__settle([message.nack(requeue=True) for message in receipt])
+
+    async def __settle(self, settlements):
+        try:
+            await asyncio.gather(*settlements)
+        except SETTLE_ERRORS as e:
+            logging.warning("rMQ: Connection failure ({err_}) settling received messages.".format(
+                err_=e.__class__.__name__,
+            ))
+
+    async def receive_continuously(self, on_individuals, should_stop):
+        queue_name = utils.get_messaging_source(self.pga_id)
+        logging.info("rMQ:{queue_}: Continuously receiving evaluated individuals.".format(queue_=queue_name))
+        await self.__consume(queue_name, on_individuals, should_stop)
+
+    async def __consume(self, queue_name, on_individuals, should_stop=None, prefetch_count=None, defer_ack=False):
+        # Deliveries are buffered until handled here, handled messages are acknowledged in bulk,
+        # the remaining ones are returned to the queue once consuming stops.
+        # With defer_ack, handled messages are left unacknowledged and returned as their receipt.
+        if prefetch_count is None:
+            prefetch_count = utils.get_property(self.pga_id, "RECEIVE_PREFETCH", DEFAULT_PREFETCH_COUNT)
+        channel = await self.__get_channel()
+        await channel.set_qos(prefetch_count=prefetch_count)
+        queue = await self.__get_queue(queue_name)
+        deliveries = asyncio.Queue()
+        consumer_tag = await queue.consume(deliveries.put, no_ack=False)
+
+        unacked_messages = []
+        try:
+            while not (should_stop is not None and should_stop()):
+                try:
+                    message = await asyncio.wait_for(deliveries.get(), timeout=CONSUME_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    continue
+
+                codec = codecs.get_codec_for_content_type(message.content_type)
+                individuals = codec.decode_individuals(codecs.decompress(message.body, message.content_encoding))
+                metrics.inc("pga_messages_received_total", self.pga_id)
+                metrics.inc("pga_bytes_received_total", self.pga_id, message.body.__len__())
+                metrics.inc("pga_individuals_received_total", self.pga_id, individuals.__len__())
+
+                unacked_messages.append(message)
+                if on_individuals(individuals, message.headers or {}):
+                    break
+                if prefetch_count and unacked_messages.__len__() >= prefetch_count:
+                    # The broker stops delivering once the prefetch window is full, acknowledge to keep receiving.
+                    # With defer_ack, the messages of an earlier generation may still wait to be persisted,
+                    # so only those received here are acknowledged.
+                    if defer_ack:
+                        logging.warning("rMQ:{queue_}: Prefetch window of {count_} messages full, acknowledging "
+                                        "messages before their individuals are persisted.".format(
+                                            queue_=queue_name,
+                                            count_=prefetch_count,
+                                        ))
+                        await asyncio.gather(*[handled.ack() for handled in unacked_messages])
+                    else:
+                        await unacked_messages[-1].ack(multiple=True)
+                    unacked_messages = []
+        finally:
+            await queue.cancel(consumer_tag)
+            if unacked_messages and not defer_ack:
+                await unacked_messages[-1].ack(multiple=True)
+            while not deliveries.empty():
+                await deliveries.get_nowait().nack(requeue=True)
+
+        if not defer_ack or not unacked_messages:
+            return None
+        return unacked_messages
+
+    async def send_message(self, individuals, next_recipient, headers=None):
+        codec = codecs.get_codec(utils.get_property(self.pga_id, "MESSAGE_CODEC"))
+        content_encoding = utils.get_property(self.pga_id, "MESSAGE_COMPRESSION")
+
+        # Shards are encoded off the event loop and published concurrently.
+        shards = split_into_shards(self.pga_id, individuals, codec)
+        bodies = await asyncio.gather(*[
+            asyncio.to_thread(lambda shard=shard: codecs.compress(codec.encode(shard), content_encoding))
+            for shard in shards
+        ])
+        if shards.__len__() == 1:
+            messages = [(headers, bodies[0])]
+        else:
+            messages = [
+                (dict(headers or {}, **{SHARD_HEADER: shard_id, SHARD_COUNT_HEADER: shards.__len__()}), body)
+                for shard_id, body in enumerate(bodies)
+            ]
+
+        await self.__get_queue(next_recipient)
+        channel = await self.__get_channel()
+        await asyncio.gather(*[
+            channel.default_exchange.publish(
+                aio_pika.Message(
+                    body=body,
+                    # Persistent messages are restored even if RabbitMQ restarts before forwarding them.
+                    delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                    content_type=codec.content_type,
+                    content_encoding=content_encoding,
+                    headers=message_headers,
+                ),
+                routing_key=next_recipient,
+            )
+            for message_headers, body in messages
+        ])
+        metrics.inc("pga_messages_sent_total", self.pga_id, messages.__len__())
+        metrics.inc("pga_bytes_sent_total", self.pga_id, sum(body.__len__() for _, body in messages))
+
+    async def send_multiple_to_init(self, individuals_amount, batch_size=1):
+        queue_name = utils.get_messaging_init_gen(self.pga_id)
+        batch_size = max(1, int(batch_size))
+        logging.info("rMQ: Sending requests for {amount_} individuals in batches of {batch_} to '{init_}'.".format(
+            amount_=individuals_amount,
+            batch_=batch_size,
+            init_=queue_name,
+        ))
+        await self.__get_queue(queue_name)
+        channel = await self.__get_channel()
+        await asyncio.gather(*[
+            channel.default_exchange.publish(
+                aio_pika.Message(
+                    body=json.dumps({"amount": min(batch_size, individuals_amount - i), "id": i}).encode("utf-8"),
+                    delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                ),
+                routing_key=queue_name,
+                mandatory=True,
+            )
+            for i in range(0, individuals_amount, batch_size)
+        ])
+        metrics.inc("pga_messages_sent_total", self.pga_id, math.ceil(individuals_amount / batch_size))
+
+    async def __get_channel(self):
+        async with self.lock:
+            if self.connection is None or self.connection.is_closed:
+                self.connection = await aio_pika.connect_robust(
+                    host="rabbitMQ--{id_}".format(id_=self.pga_id),
+                    heartbeat=HEARTBEAT_SECONDS,
+                )
+                self.channel = None
+            if self.channel is None or self.channel.is_closed:
+                self.channel = await self.connection.channel(publisher_confirms=True)
+                self.declared_queues = {}
+            return self.channel
+
+    async def __get_queue(self, queue_name):
+        # This will create the queue if it doesn't already exist, e.g. after being auto-deleted.
+        queue = self.declared_queues.get(queue_name)
+        if queue is None:
+            channel = await self.__get_channel()
+            queue = await channel.declare_queue(queue_name, auto_delete=True, durable=True)
+            self.declared_queues[queue_name] = queue
+        return queue
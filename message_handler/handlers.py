@@ -3,3 +3,4 @@ from enum import Enum
 
 class MessageHandlers(Enum):
     RabbitMQ = "rabbitMQ",
+    Local = "local",
@@ -0,0 +1,246 @@
+import importlib
+import logging
+import math
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy
+
+from message_handler.message_handler import MessageHandler, GenerationCollector, LATE_ARRIVALS_RECYCLE
+from population.population import Population, PopulationBuffer
+from utilities import metrics, utils
+
+# Seconds to wait for finished batches before checking whether to keep receiving.
+RECEIVE_POLL_SECONDS = 1
+# Batches per worker a released population is split into, unless LOCAL_CHUNK_SIZE is configured.
+CHUNKS_PER_WORKER = 4
+
+# Operator and fitness callables of the worker process, loaded once by the pool initializer.
+__WORKER_CALLABLES = {}
+
+
+def load_callable(path):
+    # Resolves a "module:function" path as given in the LOCAL_* properties.
+    module_name, separator, function_name = path.partition(":")
+    if not separator or not function_name:
+        raise Exception("No valid callable '{path_}' defined, expected 'module:function'!".format(path_=path))
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def init_worker(operator_path, fitness_path, initializer_path):
+    __WORKER_CALLABLES["operator"] = load_callable(operator_path) if operator_path else None
+    __WORKER_CALLABLES["fitness"] = load_callable(fitness_path)
+    __WORKER_CALLABLES["initializer"] = load_callable(initializer_path) if initializer_path else None
+
+
+def share_solutions(solutions):
+    # Solutions of equally long float genes are copied once into shared memory, the workers read them in place.
+    # Any other solutions are pickled along with the batch.
+    first = solutions[0]
+    if not (isinstance(first, list) and first.__len__() > 0 and all(type(gene) is float for gene in first)):
+        return None, solutions
+    if not all(isinstance(solution, list) and solution.__len__() == first.__len__() for solution in solutions):
+        return None, solutions
+
+    shape = (solutions.__len__(), first.__len__())
+    block = shared_memory.SharedMemory(create=True, size=shape[0] * shape[1] * 8)
+    numpy.ndarray(shape, dtype=numpy.float64, buffer=block.buf)[:] = solutions
+    return block, (block.name, shape)
+
+
+def process_batch(shared, apply_operator):
+    # Runs in a worker process: applies the operator to the parent solutions and evaluates the offspring.
+    if isinstance(shared, tuple):
+        block_name, shape = shared
+        block = shared_memory.SharedMemory(name=block_name)
+        # Attaching registers the block for cleanup as if created here, but the runner unlinks it.
+        resource_tracker.unregister(block._name, "shared_memory")
+        try:
+            solutions = numpy.ndarray(shape, dtype=numpy.float64, buffer=block.buf).tolist()
+        finally:
+            block.close()
+    else:
+        solutions = shared
+
+    operator = __WORKER_CALLABLES["operator"]
+    if apply_operator and operator is not None:
+        solutions = list(operator(solutions))
+    fitness = __WORKER_CALLABLES["fitness"]
+    return solutions, [float(fitness(solution)) for solution in solutions]
+
+
+def initialize_batch(first_id, amount):
+    # Runs in a worker process: generates and evaluates new solutions.
+    initializer = __WORKER_CALLABLES["initializer"]
+    solutions = [initializer(first_id + i) for i in range(amount)]
+    fitness = __WORKER_CALLABLES["fitness"]
+    return solutions, [float(fitness(solution)) for solution in solutions]
+
+
+def evaluated_buffer(solutions, fitness):
+    evaluated = PopulationBuffer()
+    evaluated.solutions.extend(solutions)
+    evaluated.fitness.extend(fitness)
+    return evaluated
+
+
+class LocalProcessPool(MessageHandler):
+    # Broker-free single-node mode: instead of passing individuals through RabbitMQ to remote model
+    # and evaluation containers, released individuals are processed in batches on a local process pool.
+    # The callables are given as "module:function" by the properties
+    # LOCAL_OPERATOR (parent solutions -> offspring solutions, optional),
+    # LOCAL_FITNESS (solution -> fitness) and LOCAL_INITIALIZER (individual id -> solution, for generated populations).
+    def __init__(self, pga_id):
+        self.pga_id = pga_id
+        properties = utils.get_pga_config(pga_id).get("properties")
+        fitness_path = properties.get("LOCAL_FITNESS")
+        if not fitness_path:
+            raise Exception("No LOCAL_FITNESS callable defined for the local process pool!")
+        self.workers = int(properties.get("LOCAL_WORKERS") or os.cpu_count() or 1)
+        self.chunk_size = properties.get("LOCAL_CHUNK_SIZE")
+
+        # Finished batches wait here with their headers until the runner receives them.
+        self.results = queue.Queue()
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.closed = False
+        # Set once a worker died abruptly, the pool accepts no more batches then.
+        self.broken = False
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=init_worker,
+            initargs=(properties.get("LOCAL_OPERATOR"), fitness_path, properties.get("LOCAL_INITIALIZER")),
+        )
+        logging.info("Local: Started process pool with {workers_} workers for PGA {id_}.".format(
+            workers_=self.workers,
+            id_=pga_id,
+        ))
+
+    def is_healthy(self):
+        return not self.closed and not self.broken
+
+    def close(self):
+        self.closed = True
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def receive_messages(self, generation=None, quorum=1.0, deadline_seconds=None,
+                         late_arrivals=LATE_ARRIVALS_RECYCLE, should_stop=None):
+        collector = GenerationCollector(
+            pga_id=self.pga_id,
+            source="Local",
+            generation=generation,
+            quorum=quorum,
+            deadline_seconds=deadline_seconds,
+            late_arrivals=late_arrivals,
+            should_stop=should_stop,
+        )
+        logging.info("Local: Waiting for generation individuals.")
+        self.__consume(collector.on_individuals, collector.stop_waiting)
+        collector.finish()
+        return None
+
+    def acknowledge(self, receipt):
+        # Results of the local workers are handed over in memory, there is nothing to acknowledge or requeue.
+        pass
+
+    def requeue(self, receipt):
+        pass
+
+    def receive_continuously(self, on_individuals, should_stop):
+        logging.info("Local: Continuously receiving evaluated individuals.")
+        self.__consume(on_individuals, should_stop)
+
+    def __consume(self, on_individuals, should_stop=None):
+        while not (should_stop is not None and should_stop()):
+            with self.lock:
+                if self.pending == 0 and self.results.empty():
+                    # Nothing released is left to wait for.
+                    return
+            try:
+                individuals, headers = self.results.get(timeout=RECEIVE_POLL_SECONDS)
+            except queue.Empty:
+                continue
+            metrics.inc("pga_individuals_received_total", self.pga_id, individuals.__len__())
+            if on_individuals(individuals, headers):
+                return
+
+    def send_message(self, individuals, next_recipient, headers=None):
+        if isinstance(individuals, (Population, PopulationBuffer)):
+            solutions = list(individuals.solutions)
+            fitness = list(individuals.fitness)
+        elif isinstance(individuals, list):
+            solutions = [individual.solution for individual in individuals]
+            fitness = [individual.fitness for individual in individuals]
+        else:
+            solutions = [individuals.solution]
+            fitness = [individuals.fitness]
+        if solutions.__len__() == 0:
+            return
+        headers = headers or {}
+
+        # Individuals sent back to the runner itself are evaluated already.
+        if next_recipient == utils.get_messaging_source(self.pga_id):
+            self.results.put((evaluated_buffer(solutions, fitness), headers))
+            return
+
+        # Individuals for the initial evaluation skip the operator, released populations go through it.
+        apply_operator = next_recipient != utils.get_messaging_init_eval(self.pga_id)
+        chunk_size = self.__chunk_size(solutions.__len__())
+        for start in range(0, solutions.__len__(), chunk_size):
+            block, shared = share_solutions(solutions[start:start + chunk_size])
+            self.__submit(block, headers, process_batch, shared, apply_operator)
+        metrics.inc("pga_messages_sent_total", self.pga_id)
+
+    def send_multiple_to_init(self, individuals_amount, batch_size=1):
+        # Generates the initial population on the pool, in batches of at least the chunk size.
+        batch_size = max(int(batch_size), self.__chunk_size(individuals_amount))
+        logging.info("Local: Generating {amount_} individuals in batches of {batch_}.".format(
+            amount_=individuals_amount,
+            batch_=batch_size,
+        ))
+        for first_id in range(0, individuals_amount, batch_size):
+            self.__submit(None, {}, initialize_batch, first_id, min(batch_size, individuals_amount - first_id))
+
+    def __chunk_size(self, amount):
+        if self.chunk_size:
+            return max(1, int(self.chunk_size))
+        return max(1, math.ceil(amount / (self.workers * CHUNKS_PER_WORKER)))
+
+    def __submit(self, block, headers, function, *args):
+        with self.lock:
+            self.pending += 1
+        try:
+            future = self.executor.submit(function, *args)
+        except BrokenProcessPool:
+            self.broken = True
+            if block is not None:
+                block.close()
+                block.unlink()
+            with self.lock:
+                self.pending -= 1
+            raise
+
+        def on_done(done_future):
+            # Release the shared memory of the batch, then hand its individuals to the receiving side.
+            if block is not None:
+                block.close()
+                block.unlink()
+            try:
+                if done_future.cancelled():
+                    # Batches still queued when the pool is closed are dropped.
+                    return
+                solutions, fitness = done_future.result()
+                self.results.put((evaluated_buffer(solutions, fitness), headers))
+            except BrokenProcessPool as e:
+                self.broken = True
+                logging.error("Local: Process pool broke processing a batch: {err_!r}".format(err_=e))
+            except Exception as e:
+                logging.error("Local: Processing a batch failed: {err_!r}".format(err_=e))
+            finally:
+                with self.lock:
+                    self.pending -= 1
+        future.add_done_callback(on_done)
@@ -1,5 +1,101 @@
+import logging
+import math
+import time
 from abc import ABC, abstractmethod
 
+from utilities import metrics, utils
+
+# Message header tagging released individuals with the generation they were released in.
+GENERATION_HEADER = "pga_generation"
+# Message headers tagging each shard of a population released in several messages with its id and the shard count.
+SHARD_HEADER = "pga_shard"
+SHARD_COUNT_HEADER = "pga_shards"
+# Message header tagging individuals released by one island of an island model run.
+ISLAND_HEADER = "pga_island"
+
+# Handling of evaluated individuals that arrive after their generation has been closed.
+LATE_ARRIVALS_DROP = "drop"
+LATE_ARRIVALS_RECYCLE = "recycle"
+
+
+class GenerationCollector(object):
+    # Collects the evaluated individuals of one generation for receive_messages, whatever the messaging service.
+    # Individuals released in an earlier generation arrive late and are recycled as candidates or dropped.
+    # The generation closes once the quorum (portion of the population) has arrived, or once the deadline has passed.
+    # source names the queue or pool received from in the logs.
+    def __init__(self, pga_id, source, generation=None, quorum=1.0, deadline_seconds=None,
+                 late_arrivals=LATE_ARRIVALS_RECYCLE, should_stop=None):
+        self.pga_id = pga_id
+        self.source = source
+        self.generation = generation
+        self.population_size = utils.get_property(pga_id, "POPULATION_SIZE")
+        self.required_amount = max(1, math.ceil(self.population_size * quorum))
+        self.deadline = time.perf_counter() + deadline_seconds if deadline_seconds else None
+        self.late_arrivals = late_arrivals
+        self.should_stop = should_stop
+        self.received = 0
+        self.late = 0
+        self.shards_received = set()
+        self.shard_count = 0
+        self.marked = None
+        self.mark()
+
+    def mark(self):
+        # Remembers what has been collected so far, once the messages it arrived with are acknowledged.
+        self.marked = (utils.count_received_individuals(self.pga_id), self.received, self.late,
+                       set(self.shards_received), self.shard_count)
+
+    def rollback(self):
+        # Forgets what has been collected since the last mark, once the broker redelivers the messages it came with.
+        buffered, self.received, self.late, shards_received, self.shard_count = self.marked
+        self.shards_received = set(shards_received)
+        utils.truncate_received_individuals(self.pga_id, buffered)
+
+    def on_individuals(self, individuals, headers):
+        # Returns True once enough individuals have arrived.
+        released_in = headers.get(GENERATION_HEADER)
+        if self.generation is not None and released_in is not None and released_in < self.generation:
+            self.late += individuals.__len__()
+            if self.late_arrivals == LATE_ARRIVALS_DROP:
+                return False
+        elif SHARD_HEADER in headers:
+            self.shards_received.add(headers[SHARD_HEADER])
+            self.shard_count = headers.get(SHARD_COUNT_HEADER, 0)
+
+        received_enough, self.received = utils.save_received_individuals(
+            self.pga_id, individuals, self.required_amount)
+        if utils.is_log_sampled("receive"):
+            logging.debug("{source_}: Received {amount_} evaluated individuals, total #{nr_} (sampled).".format(
+                source_=self.source,
+                amount_=individuals.__len__(),
+                nr_=self.received,
+            ))
+        return received_enough
+
+    def stop_waiting(self):
+        if self.should_stop is not None and self.should_stop():
+            return True
+        # Past the deadline, proceed with whatever has arrived so far, even if nothing has.
+        return self.deadline is not None and time.perf_counter() >= self.deadline
+
+    def finish(self):
+        metrics.inc("pga_late_individuals_total", self.pga_id, self.late)
+        logging.info("{source_}: Stopped receiving after {nr_} of {size_} individuals, {late_} late.".format(
+            source_=self.source,
+            nr_=self.received,
+            size_=self.population_size,
+            late_=self.late,
+        ))
+
+        # Reconcile the shards of a sharded release, if the model stage passed their headers on.
+        missing_shards = sorted(set(range(self.shard_count)) - self.shards_received)
+        if missing_shards:
+            logging.warning("{source_}: No individuals received from shards {missing_} of {count_}.".format(
+                source_=self.source,
+                missing_=missing_shards,
+                count_=self.shard_count,
+            ))
+
 
 class MessageHandler(ABC):
     @abstractmethod
@@ -8,10 +104,39 @@ class MessageHandler(ABC):
         pass
 
     @abstractmethod
-    def receive_messages(self):
+    def is_healthy(self):
+        pass
+
+    @abstractmethod
+    def close(self):
+        # releases all connections to the messaging service
+        pass
+
+    @abstractmethod
+    def receive_messages(self, generation=None, quorum=1.0, deadline_seconds=None,
+                         late_arrivals=LATE_ARRIVALS_RECYCLE, should_stop=None):
+        # waits for the evaluated individuals of the given generation until the quorum (portion of the population)
+        # has arrived, or until the deadline has passed, whatever has arrived by then;
+        # returns a receipt of the messages received, which are left unacknowledged until passed to acknowledge
+        pass
+
+    @abstractmethod
+    def acknowledge(self, receipt):
+        # acknowledges the messages of a receipt, once their individuals are persisted
+        pass
+
+    @abstractmethod
+    def requeue(self, receipt):
+        # returns the messages of a receipt to the queue, for individuals that were not used
+        pass
+
+    @abstractmethod
+    def receive_continuously(self, on_individuals, should_stop):
+        # on_individuals receives each batch of evaluated individuals and its message headers,
+        # and returns True to stop receiving
         pass
 
     @abstractmethod
-    def send_message(self, payload, remaining_destinations):
+    def send_message(self, payload, remaining_destinations, headers=None):
         # remaining_destinations is a list of strings with remaining recipients, in order of reception
         pass
@@ -1,134 +1,497 @@
 import json
 import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import pika
+from pika.adapters.blocking_connection import ReturnedMessage
 
-from message_handler.message_handler import MessageHandler
-from population.individual import Individual, IndividualEncoder
-from utilities import utils
+from message_handler.message_handler import MessageHandler, GenerationCollector, SHARD_HEADER, SHARD_COUNT_HEADER, \
+    LATE_ARRIVALS_RECYCLE
+from population import codecs
+from population.population import Population, PopulationBuffer
+from utilities import metrics, utils
 
 
-def receive_evaluated_individuals_callback(channel, method, properties, body):
-    queue_name = utils.get_messaging_source()
+# Unacknowledged messages the broker may push to the runner, configurable by the RECEIVE_PREFETCH property.
+DEFAULT_PREFETCH_COUNT = 1000
+# Seconds to wait for broker events before checking whether to keep consuming.
+CONSUME_POLL_SECONDS = 1
+# Connection liveness and recovery settings.
+HEARTBEAT_SECONDS = 60
+BLOCKED_CONNECTION_TIMEOUT = 300
+RECONNECT_ATTEMPTS = 5
+RECONNECT_BACKOFF_SECONDS = 2
+# Seconds a health probe waits for a connection, it is attempted once.
+PROBE_TIMEOUT_SECONDS = 2
+# Threads encoding and compressing the shards of a released population side by side.
+ENCODE_WORKERS = 4
+# Individuals encoded to estimate the message size of a population for sharding by RELEASE_SHARD_BYTES.
+SHARD_SIZE_SAMPLE = 100
 
-    ind_dict = json.loads(body)
-    individual = Individual(ind_dict["solution"], ind_dict["fitness"])
+# Errors after which the connection is re-established. Rejected publishes are not among them.
+RECONNECTABLE_ERRORS = (
+    pika.exceptions.AMQPConnectionError,
+    pika.exceptions.ChannelClosed,
+    pika.exceptions.ChannelWrongStateError,
+)
 
-    received_all, individual_number = utils.save_received_individual(individual)
-    logging.info("rMQ:{queue_}: Received evaluated individual #{nr_}: {ind_}".format(
-        queue_=queue_name,
-        nr_=individual_number,
-        ind_=individual,
-    ))
+# Channels of a connection, by purpose.
+CHANNEL_CONSUME = "consume"
+CHANNEL_PUBLISH = "publish"
+CHANNEL_PUBLISH_TRANSACTED = "publish_transacted"
+# Generation requests published per transaction when initializing a population.
+INIT_COMMIT_WINDOW = 100
+
+
+class EvaluatedIndividualsConsumer(object):
+    # Consumes evaluated individuals and hands them with the message headers to on_individuals,
+    # which returns True to stop consuming. With defer_ack, the messages handed over are left unacknowledged
+    # when consuming stops, for the caller to acknowledge once their individuals are persisted;
+    # on_acknowledged is called whenever they have to be acknowledged before, as the prefetch window is full.
+    # Per-message constants are resolved once when consuming starts.
+    def __init__(self, pga_id, queue_name, on_individuals, prefetch_count, defer_ack=False, on_acknowledged=None):
+        self.pga_id = pga_id
+        self.queue_name = queue_name
+        self.on_individuals = on_individuals
+        self.prefetch_count = prefetch_count
+        self.defer_ack = defer_ack
+        self.on_acknowledged = on_acknowledged
+        self.unacked_messages = 0
+        self.first_delivery_tag = None
+        self.last_delivery_tag = None
+        self.stopped = False
+
+    def __call__(self, channel, method, properties, body):
+        if self.stopped:
+            # Return surplus messages delivered before the consumer is cancelled to the queue right away.
+            channel.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            return
+
+        # Messages carry either a single evaluated individual or a list of them,
+        # encoded with the codec tagged in their content type and optionally compressed.
+        codec = codecs.get_codec_for_content_type(properties.content_type)
+        individuals = codec.decode_individuals(codecs.decompress(body, properties.content_encoding))
+        metrics.inc("pga_messages_received_total", self.pga_id)
+        metrics.inc("pga_bytes_received_total", self.pga_id, body.__len__())
+        metrics.inc("pga_individuals_received_total", self.pga_id, individuals.__len__())
+
+        if self.unacked_messages == 0:
+            self.first_delivery_tag = method.delivery_tag
+        self.unacked_messages += 1
+        self.last_delivery_tag = method.delivery_tag
+        if self.on_individuals(individuals, properties.headers or {}):
+            if not self.defer_ack:
+                self.ack_received(channel)
+            self.stopped = True
+        elif self.prefetch_count and self.unacked_messages >= self.prefetch_count:
+            # The broker stops delivering once the prefetch window is full, acknowledge to keep receiving.
+            if self.defer_ack:
+                logging.warning("rMQ:{queue_}: Prefetch window of {count_} messages full, acknowledging messages "
+                                "before their individuals are persisted.".format(
+                                    queue_=self.queue_name,
+                                    count_=self.prefetch_count,
+                                ))
+            self.ack_received(channel)
+            if self.defer_ack and self.on_acknowledged is not None:
+                self.on_acknowledged()
+
+    def ack_received(self, channel):
+        # Acknowledge all messages received so far with a single bulk ack. With defer_ack, the messages of an
+        # earlier generation may still wait to be persisted, so only those received here are acknowledged.
+        if self.unacked_messages > 0:
+            if self.defer_ack:
+                for delivery_tag in range(self.first_delivery_tag, self.last_delivery_tag + 1):
+                    channel.basic_ack(delivery_tag=delivery_tag)
+            else:
+                channel.basic_ack(delivery_tag=self.last_delivery_tag, multiple=True)
+            self.unacked_messages = 0
 
-    if received_all:
-        channel.stop_consuming()
-        logging.info("rMQ:{queue_}: Stopped consuming.".format(
-            queue_=queue_name,
-        ))
 
+def split_into_shards(pga_id, individuals, codec):
+    # Splits a population into RELEASE_SHARDS shards, or into as many as needed to keep every shard
+    # below RELEASE_SHARD_BYTES, as estimated from a sample of encoded individuals.
+    if not isinstance(individuals, (Population, PopulationBuffer)) or individuals.__len__() <= 1:
+        return [individuals]
+    if isinstance(individuals, PopulationBuffer):
+        individuals = individuals.to_population()
+    shard_count = utils.get_property(pga_id, "RELEASE_SHARDS") or 1
+    shard_bytes = utils.get_property(pga_id, "RELEASE_SHARD_BYTES")
+    if shard_bytes:
+        sample = individuals[:SHARD_SIZE_SAMPLE]
+        estimated_bytes = codec.encode(sample).__len__() * individuals.__len__() / sample.__len__()
+        shard_count = max(shard_count, math.ceil(estimated_bytes / shard_bytes))
+    if shard_count <= 1:
+        return [individuals]
+    return individuals.split(shard_count)
 
-def send_message_to_queue(channel, payload, next_recipient):
-    # This will create the exchange if it doesn't already exist.
-    channel.queue_declare(queue=next_recipient, auto_delete=True, durable=True)
 
+def send_message_to_queue(channel, body, next_recipient, codec, headers=None, content_encoding=None):
     # Send message to given recipient.
-    logging.info("rMQ: Sending {body_} to {dest_}.".format(
-        body_=payload,
-        dest_=next_recipient,
-    ))
+    if utils.is_log_sampled("rMQ:send"):
+        logging.debug("rMQ: Sending {size_} bytes to {dest_} (sampled).".format(
+            size_=body.__len__(),
+            dest_=next_recipient,
+        ))
     channel.basic_publish(
         exchange="",
         routing_key=next_recipient,
-        body=json.dumps(payload, cls=IndividualEncoder),
+        body=body,
         # Delivery mode 2 makes the broker save the message to disk.
         # This will ensure that the message be restored on reboot even
         # if RabbitMQ crashes before having forwarded the message.
+        # The content type and encoding tell the recipient how to decode the body.
         properties=pika.BasicProperties(
             delivery_mode=2,
+            content_type=codec.content_type,
+            content_encoding=content_encoding,
+            headers=headers,
         ),
     )
+    return body.__len__()
+
+
+def get_host(pga_id):
+    return "rabbitMQ--{id_}".format(id_=pga_id)
+
+
+def probe(pga_id):
+    # Checks whether the broker of a PGA accepts connections with a single attempt, without creating a handler.
+    try:
+        connection = pika.BlockingConnection(pika.ConnectionParameters(
+            host=get_host(pga_id),
+            connection_attempts=1,
+            socket_timeout=PROBE_TIMEOUT_SECONDS,
+            stack_timeout=PROBE_TIMEOUT_SECONDS,
+        ))
+    except pika.exceptions.AMQPError:
+        return False
+    connection.close()
+    return True
 
 
 class RabbitMessageQueue(MessageHandler):
+    # One connection per PGA, shared by all threads: every use of the connection holds the lock,
+    # consuming only holds it while processing broker events, so publishing threads can interleave.
+    # Lost connections are re-established with their queues re-declared.
     def __init__(self, pga_id):
-        # Establish connection to rabbitMQ.
-        self.connection = pika.BlockingConnection(pika.ConnectionParameters(
-            host="rabbitMQ--{id_}".format(id_=pga_id),
+        self.pga_id = pga_id
+        self.connection_parameters = pika.ConnectionParameters(
+            host=get_host(pga_id),
             socket_timeout=30,
-        ))
-        self.channel_receive_generation = None
-        self.channel_send_init = None
-        self.channel_send_any = {}
-
-    def receive_messages(self):
-        # Define communication channel.
-        if self.channel_receive_generation is None:
-            channel = self.connection.channel()
-            self.channel_receive_generation = channel
-        else:
-            channel = self.channel_receive_generation
+            heartbeat=HEARTBEAT_SECONDS,
+            blocked_connection_timeout=BLOCKED_CONNECTION_TIMEOUT,
+        )
+        self.connection = None
+        self.connection_number = 0
+        self.channels = {}
+        self.declared_queues = set()
+        self.returned_messages = []
+        self.lock = threading.RLock()
+        self.encoder = ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix="rmq-encode")
 
-        # Create queue for returning individuals as end of one generation.
-        queue_name = utils.get_messaging_source()
-        channel.queue_declare(queue=queue_name, auto_delete=True, durable=True)
+        # Establish connection to rabbitMQ.
+        self.__run(self.__get_connection)
+
+    def is_healthy(self):
+        with self.lock:
+            return self.connection is not None and self.connection.is_open
 
-        # Actively listen for messages in queue and perform callback on receive.
-        channel.basic_consume(
-            queue=queue_name,
-            on_message_callback=receive_evaluated_individuals_callback,
-            auto_ack=True
+    def close(self):
+        with self.lock:
+            if self.connection is not None and self.connection.is_open:
+                self.connection.close()
+            self.connection = None
+            self.channels = {}
+        self.encoder.shutdown(wait=False)
+
+    def receive_messages(self, generation=None, quorum=1.0, deadline_seconds=None,
+                         late_arrivals=LATE_ARRIVALS_RECYCLE, should_stop=None):
+        queue_name = utils.get_messaging_source(self.pga_id)
+        collector = GenerationCollector(
+            pga_id=self.pga_id,
+            source="rMQ:{queue_}".format(queue_=queue_name),
+            generation=generation,
+            quorum=quorum,
+            deadline_seconds=deadline_seconds,
+            late_arrivals=late_arrivals,
+            should_stop=should_stop,
         )
         logging.info("rMQ:{queue_}: Waiting for generation individuals feedback.".format(
             queue_=queue_name
         ))
-        channel.start_consuming()
 
-    def send_message(self, individuals, next_recipient):
-        # Define communication channel.
-        channel_keys = [*self.channel_send_any]
-        if channel_keys.__len__() > 0 and channel_keys.__contains__(next_recipient):
-            channel = self.channel_send_any[next_recipient]
-        else:
-            channel = self.connection.channel()
-            self.channel_send_any[next_recipient] = channel
+        # The messages are acknowledged once the generation is persisted, so the prefetch window has to hold
+        # those of the generation being persisted and those of the generation being received.
+        prefetch_count = max(
+            utils.get_property(self.pga_id, "RECEIVE_PREFETCH", DEFAULT_PREFETCH_COUNT),
+            2 * collector.population_size,
+        )
+        # The individuals of messages redelivered after a reconnect are collected again, so those received
+        # since the last acknowledgement are forgotten then.
+        receipt = self.__consume(queue_name, collector.on_individuals, collector.stop_waiting,
+                                 prefetch_count=prefetch_count, defer_ack=True,
+                                 on_acknowledged=collector.mark, on_requeued=collector.rollback)
+        collector.finish()
+        return receipt
+
+    def acknowledge(self, receipt):
+        # Acknowledge all messages of the receipt with a single bulk ack, those of earlier generations are
+        # acknowledged already. After a reconnect there is nothing to acknowledge,
+        # the broker requeued the messages along with the lost channel.
+        self.__settle(receipt, lambda: receipt["channel"].basic_ack(
+            delivery_tag=receipt["delivery_tag"],
+            multiple=True,
+        ))
+
+    def requeue(self, receipt):
+        # Rejects each message of the receipt on its own, those of the generation still being persisted are left.
+        def requeue_messages():
+            for delivery_tag in range(receipt["first_delivery_tag"], receipt["delivery_tag"] + 1):
+                receipt["channel"].basic_nack(delivery_tag=delivery_tag, requeue=True)
+        self.__settle(receipt, requeue_messages)
 
-        send_message_to_queue(
-            channel=channel,
-            payload=individuals,
-            next_recipient=next_recipient,
+    def __settle(self, receipt, settle):
+        if receipt is None:
+            return
+        with self.lock:
+            if receipt["connection_number"] != self.connection_number or not receipt["channel"].is_open:
+                return
+            try:
+                settle()
+            except RECONNECTABLE_ERRORS as e:
+                logging.warning("rMQ: Connection failure ({err_}) settling received messages.".format(
+                    err_=e.__class__.__name__,
+                ))
+
+    def receive_continuously(self, on_individuals, should_stop):
+        # Hands every received batch of evaluated individuals to on_individuals until should_stop returns True.
+        queue_name = utils.get_messaging_source(self.pga_id)
+        logging.info("rMQ:{queue_}: Continuously receiving evaluated individuals.".format(
+            queue_=queue_name
+        ))
+        self.__consume(queue_name, on_individuals, should_stop)
+
+    def __consume(self, queue_name, on_individuals, should_stop=None, prefetch_count=None, defer_ack=False,
+                  on_acknowledged=None, on_requeued=None):
+        # Returns the receipt of the messages left unacknowledged with defer_ack, None without.
+        # With defer_ack, on_requeued is called once the broker requeued those messages along with a lost connection.
+        if prefetch_count is None:
+            prefetch_count = utils.get_property(self.pga_id, "RECEIVE_PREFETCH", DEFAULT_PREFETCH_COUNT)
+        consumer = EvaluatedIndividualsConsumer(
+            pga_id=self.pga_id,
+            queue_name=queue_name,
+            on_individuals=on_individuals,
+            prefetch_count=prefetch_count,
+            defer_ack=defer_ack,
+            on_acknowledged=on_acknowledged,
         )
 
-    def send_multiple_to_init(self, individuals_amount):
-        # Define communication channel.
-        if self.channel_send_init is None:
-            channel = self.connection.channel()
-            self.channel_send_init = channel
+        def requeued():
+            if defer_ack and on_requeued is not None:
+                on_requeued()
+
+        def start_consuming():
+            # Define communication channel and create queue for returning individuals.
+            channel = self.__get_channel(CHANNEL_CONSUME)
+            self.__declare_queue(channel, queue_name)
+            channel.basic_qos(prefetch_count=prefetch_count)
+
+            # Actively listen for messages in queue and perform callback on receive.
+            # Messages are acknowledged manually once their individuals have been handed over,
+            # so the broker redelivers them if the runner fails before.
+            consumer.unacked_messages = 0
+            consumer_tag = channel.basic_consume(
+                queue=queue_name,
+                on_message_callback=consumer,
+                auto_ack=False,
+            )
+            return channel, consumer_tag, self.connection_number
+
+        channel, consumer_tag, consuming_on = self.__run(start_consuming)
+        while True:
+            if consuming_on != self.connection_number:
+                # The connection has been re-established, the broker requeued all unacknowledged messages
+                # and redelivers them, also those that made the consumer stop.
+                logging.warning("rMQ:{queue_}: Resuming consumer on new connection.".format(queue_=queue_name))
+                requeued()
+                consumer.stopped = False
+                channel, consumer_tag, consuming_on = self.__run(start_consuming)
+            if consumer.stopped or (should_stop is not None and should_stop()):
+                break
+            self.__run(lambda: self.__get_connection().process_data_events(time_limit=CONSUME_POLL_SECONDS))
+
+        def stop_consuming():
+            # A consumer on a lost channel is gone already, along with its unacknowledged messages.
+            # Messages left unacknowledged stay with the channel after cancelling the consumer.
+            if channel.is_open:
+                if not consumer.defer_ack:
+                    consumer.ack_received(channel)
+                channel.basic_cancel(consumer_tag)
+        self.__run(stop_consuming)
+
+        if consuming_on != self.connection_number:
+            # Lost while stopping, the messages come back to the queue for the next consumer.
+            requeued()
+            return None
+        if not consumer.defer_ack or consumer.unacked_messages == 0:
+            return None
+        return {
+            "connection_number": consuming_on,
+            "channel": channel,
+            "first_delivery_tag": consumer.first_delivery_tag,
+            "delivery_tag": consumer.last_delivery_tag,
+        }
+
+    def send_message(self, individuals, next_recipient, headers=None):
+        codec = codecs.get_codec(utils.get_property(self.pga_id, "MESSAGE_CODEC"))
+        content_encoding = utils.get_property(self.pga_id, "MESSAGE_COMPRESSION")
+
+        # Populations may be released in several shards, each a message of its own for any model worker.
+        # The shards are encoded side by side, publishing them needs no broker round trip each.
+        shards = split_into_shards(self.pga_id, individuals, codec)
+        if shards.__len__() == 1:
+            messages = [(headers, codecs.compress(codec.encode(individuals), content_encoding))]
         else:
-            channel = self.channel_send_init
+            bodies = self.encoder.map(lambda shard: codecs.compress(codec.encode(shard), content_encoding), shards)
+            messages = [
+                (dict(headers or {}, **{SHARD_HEADER: shard_id, SHARD_COUNT_HEADER: shards.__len__()}), body)
+                for shard_id, body in enumerate(bodies)
+            ]
 
-        # Create the queue if it doesn't exist already.
-        queue_name = utils.get_messaging_init_gen()
-        channel.queue_declare(queue=queue_name, auto_delete=True, durable=True)
+        def publish():
+            # Define communication channel, shared for all recipients.
+            channel = self.__get_channel(CHANNEL_PUBLISH)
+            self.__declare_queue(channel, next_recipient)
+            return sum(
+                send_message_to_queue(
+                    channel=channel,
+                    body=body,
+                    next_recipient=next_recipient,
+                    codec=codec,
+                    headers=message_headers,
+                    content_encoding=content_encoding,
+                )
+                for message_headers, body in messages
+            )
+        sent_bytes = self.__run(publish)
+        metrics.inc("pga_messages_sent_total", self.pga_id, messages.__len__())
+        metrics.inc("pga_bytes_sent_total", self.pga_id, sent_bytes)
+
+    def send_multiple_to_init(self, individuals_amount, batch_size=1):
+        queue_name = utils.get_messaging_init_gen(self.pga_id)
+
+        # Pack up to batch_size generation requests into one message, identified by the id of its first individual.
+        # The requests are published in transactions of INIT_COMMIT_WINDOW messages, the broker takes each window
+        # in a single commit round trip, so small batches no longer cost a round trip per message.
+        batch_size = max(1, int(batch_size))
+        logging.info("rMQ: Sending requests for {amount_} individuals in batches of {batch_} to '{init_}'.".format(
+            amount_=individuals_amount,
+            batch_=batch_size,
+            init_=queue_name,
+        ))
+        window_amount = batch_size * INIT_COMMIT_WINDOW
+        for window_start in range(0, individuals_amount, window_amount):
+            payloads = [
+                {
+                    "amount": min(batch_size, individuals_amount - i),
+                    "id": i,
+                }
+                for i in range(window_start, min(window_start + window_amount, individuals_amount), batch_size)
+            ]
+            if utils.is_log_sampled("rMQ:init"):
+                logging.debug("rMQ: Sending {count_} requests from '{body_}' to '{init_}' (sampled).".format(
+                    count_=payloads.__len__(),
+                    body_=payloads[0],
+                    init_=queue_name,
+                ))
+            try:
+                sent_bytes = self.__run(lambda: self.__publish_transacted(queue_name, payloads))
+                metrics.inc("pga_messages_sent_total", self.pga_id, payloads.__len__())
+                metrics.inc("pga_bytes_sent_total", self.pga_id, sent_bytes)
+            except pika.exceptions.UnroutableError as e:
+                logging.error("rMQ: Broker returned {count_} of the requests from '{body_}' for '{init_}'.".format(
+                    count_=e.messages.__len__(),
+                    body_=payloads[0],
+                    init_=queue_name,
+                ))
+                raise
 
-        # Send message to given recipient.
-        for i in range(0, individuals_amount):
-            payload = {
-                "amount": 1,
-                "id": i,
-            }
-            logging.info("rMQ: Sending '{body_}' to '{init_}'.".format(
-                body_=payload,
-                init_=queue_name,
-            ))
+    def __publish_transacted(self, queue_name, payloads):
+        # Define communication channel, in transaction mode the broker takes all publishes at the commit.
+        # A window interrupted by a connection failure is rolled back by the broker and published again.
+        channel = self.__get_channel(CHANNEL_PUBLISH_TRANSACTED)
+        self.__declare_queue(channel, queue_name)
+        self.returned_messages = []
+        sent_bytes = 0
+        for payload in payloads:
+            body = json.dumps(payload)
             channel.basic_publish(
                 exchange="",
                 routing_key=queue_name,
-                body=json.dumps(payload),
+                body=body,
                 # Delivery mode 2 makes the broker save the message to disk.
                 # This will ensure that the message be restored on reboot even
                 # if RabbitMQ crashes before having forwarded the message.
                 properties=pika.BasicProperties(
                     delivery_mode=2,
                 ),
+                mandatory=True,
             )
+            sent_bytes += body.__len__()
+        channel.tx_commit()
+
+        # Unroutable messages are returned before the commit completes, dispatch their return callbacks.
+        self.__get_connection().process_data_events(time_limit=0)
+        if self.returned_messages:
+            raise pika.exceptions.UnroutableError(self.returned_messages)
+        return sent_bytes
+
+    def __run(self, operation):
+        # Runs an operation on the connection, re-establishing the connection and retrying on connection failures.
+        for attempt in range(1, RECONNECT_ATTEMPTS + 1):
+            with self.lock:
+                try:
+                    return operation()
+                except RECONNECTABLE_ERRORS as e:
+                    logging.warning("rMQ: Connection failure ({err_}), reconnecting, attempt {att_}.".format(
+                        err_=e.__class__.__name__,
+                        att_=attempt,
+                    ))
+                    self.connection = None
+                    self.channels = {}
+            time.sleep(RECONNECT_BACKOFF_SECONDS * attempt)
+        raise Exception("Error connecting to rabbitMQ--{id_}: giving up after {att_} attempts!".format(
+            id_=self.pga_id,
+            att_=RECONNECT_ATTEMPTS,
+        ))
+
+    def __get_connection(self):
+        if self.connection is None or not self.connection.is_open:
+            self.connection = pika.BlockingConnection(self.connection_parameters)
+            self.connection_number += 1
+            self.channels = {}
+        return self.connection
+
+    def __get_channel(self, purpose):
+        # Reuses one channel per purpose, new channels re-declare all queues used before.
+        channel = self.channels.get(purpose)
+        if channel is None or not channel.is_open:
+            channel = self.__get_connection().channel()
+            if purpose == CHANNEL_PUBLISH_TRANSACTED:
+                channel.tx_select()
+                channel.add_on_return_callback(self.__on_returned)
+            for queue_name in self.declared_queues:
+                self.__declare_queue(channel, queue_name)
+            self.channels[purpose] = channel
+        return channel
+
+    def __on_returned(self, channel, method, properties, body):
+        self.returned_messages.append(ReturnedMessage(method, properties, body))
+
+    def __declare_queue(self, channel, queue_name):
+        # This will create the queue if it doesn't already exist, e.g. after being auto-deleted.
+        channel.queue_declare(queue=queue_name, auto_delete=True, durable=True)
+        self.declared_queues.add(queue_name)
@@ -0,0 +1,160 @@
+import json
+import struct
+import zlib
+from array import array
+
+import msgpack
+
+from population.individual import Individual, IndividualEncoder
+from population.population import Population, PopulationBuffer
+
+DEFAULT_CODEC = "json"
+COMPRESSION_LEVEL = 1
+
+# Struct codec layout: amount of individuals, then per individual its fitness,
+# the solution kind and the length of the solution bytes, followed by the solution bytes.
+_STRUCT_HEADER = struct.Struct("<I")
+_STRUCT_INDIVIDUAL = struct.Struct("<dBI")
+_SOLUTION_TEXT = 0
+_SOLUTION_JSON = 1
+_SOLUTION_FLOATS = 2
+
+
+def _individual_dicts(payload):
+    # Brings any individuals payload into a list of plain individual dicts.
+    if isinstance(payload, Individual):
+        return [payload.to_dict()]
+    if isinstance(payload, (Population, PopulationBuffer)):
+        return [{"solution": solution, "fitness": float(fitness)}
+                for solution, fitness in zip(payload.solutions, payload.fitness)]
+    return [individual.to_dict() if isinstance(individual, Individual) else individual for individual in payload]
+
+
+def _to_buffer(individual_dicts):
+    if isinstance(individual_dicts, dict):
+        individual_dicts = [individual_dicts]
+    individuals = PopulationBuffer()
+    for ind_dict in individual_dicts:
+        individuals.add(ind_dict["solution"], ind_dict.get("fitness"))
+    return individuals
+
+
+class JsonCodec(object):
+    name = "json"
+    content_type = "application/json"
+
+    def encode(self, payload):
+        return json.dumps(payload, cls=IndividualEncoder).encode("utf-8")
+
+    def decode_individuals(self, body):
+        return _to_buffer(json.loads(body))
+
+
+class MsgpackCodec(object):
+    name = "msgpack"
+    content_type = "application/msgpack"
+
+    def encode(self, payload):
+        if not isinstance(payload, dict):
+            payload = _individual_dicts(payload)
+        return msgpack.packb(payload, use_bin_type=True)
+
+    def decode_individuals(self, body):
+        return _to_buffer(msgpack.unpackb(body, raw=False))
+
+
+class StructCodec(object):
+    # Packs the fitness of each individual as a binary header next to its raw solution bytes.
+    # Text solutions are shipped as utf-8 bytes and lists of floats as raw doubles,
+    # any other solution falls back to its JSON text.
+    name = "struct"
+    content_type = "application/x-pga-individuals"
+
+    def encode(self, payload):
+        if isinstance(payload, Individual):
+            payload = [payload]
+        if isinstance(payload, (Population, PopulationBuffer)):
+            pairs = zip(payload.solutions, payload.fitness)
+            amount = payload.__len__()
+        else:
+            pairs = [(individual.solution, individual.fitness) for individual in payload]
+            amount = pairs.__len__()
+
+        parts = [_STRUCT_HEADER.pack(amount)]
+        for solution, fitness in pairs:
+            if isinstance(solution, str):
+                kind = _SOLUTION_TEXT
+                raw = solution.encode("utf-8")
+            elif isinstance(solution, list) and all(type(gene) is float for gene in solution):
+                kind = _SOLUTION_FLOATS
+                raw = array("d", solution).tobytes()
+            else:
+                kind = _SOLUTION_JSON
+                raw = json.dumps(solution).encode("utf-8")
+            parts.append(_STRUCT_INDIVIDUAL.pack(float(fitness), kind, raw.__len__()))
+            parts.append(raw)
+        return b"".join(parts)
+
+    def decode_individuals(self, body):
+        body = memoryview(body)
+        individuals = PopulationBuffer()
+        (amount,) = _STRUCT_HEADER.unpack_from(body, 0)
+        offset = _STRUCT_HEADER.size
+        for _ in range(amount):
+            fitness, kind, length = _STRUCT_INDIVIDUAL.unpack_from(body, offset)
+            offset += _STRUCT_INDIVIDUAL.size
+            raw = body[offset:offset + length]
+            offset += length
+            if kind == _SOLUTION_TEXT:
+                solution = str(raw, "utf-8")
+            elif kind == _SOLUTION_FLOATS:
+                genes = array("d")
+                genes.frombytes(raw)
+                solution = genes.tolist()
+            else:
+                solution = json.loads(bytes(raw))
+            individuals.add(solution, fitness)
+        return individuals
+
+
+_CODECS = [JsonCodec(), MsgpackCodec(), StructCodec()]
+_CODECS_BY_NAME = {codec.name: codec for codec in _CODECS}
+_CODECS_BY_CONTENT_TYPE = {codec.content_type: codec for codec in _CODECS}
+
+
+def get_codec(codec_name=None):
+    # Selects the codec configured for a PGA, by name as given in the MESSAGE_CODEC property.
+    if codec_name is None:
+        codec_name = DEFAULT_CODEC
+    if isinstance(codec_name, bytes):
+        codec_name = codec_name.decode("utf-8")
+    codec = _CODECS_BY_NAME.get(codec_name.lower())
+    if codec is None:
+        raise Exception("No valid message codec '{name_}' defined!".format(name_=codec_name))
+    return codec
+
+
+# Message body compressions by their AMQP content encoding.
+_COMPRESSIONS = {
+    "zlib": (lambda body: zlib.compress(body, COMPRESSION_LEVEL), zlib.decompress),
+}
+
+
+def compress(body, content_encoding):
+    if not content_encoding:
+        return body
+    compression = _COMPRESSIONS.get(content_encoding.lower())
+    if compression is None:
+        raise Exception("No valid message compression '{name_}' defined!".format(name_=content_encoding))
+    return compression[0](body)
+
+
+def decompress(body, content_encoding):
+    # Bodies without (known) content encoding are taken as they are.
+    compression = _COMPRESSIONS.get(content_encoding.lower()) if content_encoding else None
+    return compression[1](body) if compression is not None else body
+
+
+def get_codec_for_content_type(content_type):
+    # Messages without (known) content type come from JSON-speaking components.
+    return _CODECS_BY_CONTENT_TYPE.get(content_type, _CODECS_BY_NAME[DEFAULT_CODEC])
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+
+DEFAULT_CACHE_SIZE = 100000
+
+
+def solution_key(solution):
+    # Canonical hash of a solution, independent of the key order of mappings.
+    canonical = json.dumps(solution, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class FitnessCache(object):
+    # Remembers the fitness of evaluated solutions in an in-process LRU,
+    # optionally backed by a tier shared between runners through the database handler.
+    def __init__(self, capacity=DEFAULT_CACHE_SIZE, database_handler=None):
+        self.capacity = capacity
+        self.database_handler = database_handler
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, solutions):
+        # Returns the cached fitness of the given solutions as a list, None for unknown solutions.
+        keys = [solution_key(solution) for solution in solutions]
+        found = [self.__get_local(key) for key in keys]
+
+        missing = [i for i, fitness in enumerate(found) if fitness is None]
+        if missing and self.database_handler is not None:
+            shared = self.database_handler.retrieve_fitness([keys[i] for i in missing])
+            for i, fitness in zip(missing, shared):
+                if fitness is not None:
+                    found[i] = float(fitness)
+                    self.__put_local(keys[i], found[i])
+
+        hits = sum(1 for fitness in found if fitness is not None)
+        self.hits += hits
+        self.misses += found.__len__() - hits
+        return found
+
+    def count_known(self, population):
+        # Counts solutions of an evaluated population that had already been evaluated before,
+        # i.e. duplicate evaluations, and remembers the new ones.
+        known = 0
+        new_entries = {}
+        for solution, fitness in zip(population.solutions, population.fitness.tolist()):
+            key = solution_key(solution)
+            if self.__get_local(key) is not None:
+                known += 1
+            else:
+                new_entries[key] = fitness
+                self.__put_local(key, fitness)
+        self.hits += known
+        self.misses += new_entries.__len__()
+        self.__store_shared(new_entries)
+        return known
+
+    def record(self, population):
+        # Remembers the fitness of an evaluated population without counting lookups.
+        new_entries = {}
+        for solution, fitness in zip(population.solutions, population.fitness.tolist()):
+            key = solution_key(solution)
+            self.__put_local(key, fitness)
+            new_entries[key] = fitness
+        self.__store_shared(new_entries)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def stats(self):
+        return {
+            "size": self.entries.__len__(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate(),
+        }
+
+    def __get_local(self, key):
+        fitness = self.entries.get(key)
+        if fitness is not None:
+            self.entries.move_to_end(key)
+        return fitness
+
+    def __put_local(self, key, fitness):
+        if self.capacity <= 0:
+            return
+        self.entries[key] = fitness
+        self.entries.move_to_end(key)
+        while self.entries.__len__() > self.capacity:
+            self.entries.popitem(last=False)
+
+    def __store_shared(self, new_entries):
+        if new_entries and self.database_handler is not None:
+            logging.debug("Sharing fitness of {amount_} solutions.".format(amount_=new_entries.__len__()))
+            self.database_handler.store_fitness(new_entries)
@@ -4,16 +4,28 @@ DEFAULT_FITNESS = 0.0
 
 
 class Individual(object):
+    # Slotted to keep single individuals small, populations store their individuals in a Population instead.
+    __slots__ = ("solution", "fitness")
+
     def __init__(self, solution, fitness=None):
         self.solution = solution
         self.fitness = fitness if fitness else DEFAULT_FITNESS
 
     def __repr__(self):
-        return '{"solution": ' + self.solution + '; "fitness": ' + str(self.fitness) + '}'
+        return '{"solution": ' + str(self.solution) + '; "fitness": ' + str(self.fitness) + '}'
+
+    def to_dict(self):
+        return {"solution": self.solution, "fitness": self.fitness}
 
 
 # Make class JSON serializable:
 # https://pynative.com/make-python-class-json-serializable/
 class IndividualEncoder(JSONEncoder):
     def default(self, obj):
+        if isinstance(obj, Individual):
+            return obj.to_dict()
+        # Populations are serialized as plain lists of individuals.
+        to_list = getattr(obj, "to_list", None)
+        if to_list is not None:
+            return to_list()
         return obj.__dict__
@@ -0,0 +1,136 @@
+import json
+
+import yaml
+
+# Prefer the libyaml based loader, it parses several times faster than the pure Python one.
+try:
+    from yaml import CSafeLoader as StreamLoader
+except ImportError:
+    from yaml import SafeLoader as StreamLoader
+
+# Solutions read from a population file per batch.
+DEFAULT_LOAD_BATCH_SIZE = 1000
+JSON_LINES_EXTENSIONS = (".jsonl", ".ndjson")
+# Tag of the "<<" key merging other mappings into a mapping.
+MERGE_TAG = "tag:yaml.org,2002:merge"
+
+
+def iter_solutions(file_path):
+    # Reads the solutions of a provided population one at a time: from JSON Lines files one solution per line,
+    # from YAML files the items of the top-level "individuals" list, parsed event by event.
+    if file_path.endswith(JSON_LINES_EXTENSIONS):
+        return _iter_json_lines(file_path)
+    return _iter_yaml_individuals(file_path)
+
+
+def iter_batches(solutions, batch_size=DEFAULT_LOAD_BATCH_SIZE):
+    batch = []
+    for solution in solutions:
+        batch.append(solution)
+        if batch.__len__() >= batch_size:
+            yield batch
+            batch = []
+    if batch.__len__() > 0:
+        yield batch
+
+
+def _iter_json_lines(file_path):
+    with open(file_path, mode="r", encoding="utf-8") as population_file:
+        for line in population_file:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def _iter_yaml_individuals(file_path):
+    with open(file_path, mode="r", encoding="utf-8") as population_file:
+        loader = StreamLoader(population_file)
+        # Anchored values by anchor name, for the aliases referring to them later on.
+        anchors = {}
+        try:
+            # Skip to the value of the top-level "individuals" key.
+            depth = 0
+            expecting_key = False
+            while loader.check_event():
+                event = loader.get_event()
+                if isinstance(event, yaml.ScalarEvent) and depth == 1 and expecting_key:
+                    if event.value == "individuals":
+                        break
+                    _skip_node(loader, anchors)
+                    continue
+                if isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+                    depth += 1
+                    expecting_key = isinstance(event, yaml.MappingStartEvent)
+                elif isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+                    depth -= 1
+            else:
+                return
+
+            if not isinstance(loader.get_event(), yaml.SequenceStartEvent):
+                raise Exception("Error reading population file {path_}: individuals are no list!".format(
+                    path_=file_path,
+                ))
+            while not loader.check_event(yaml.SequenceEndEvent):
+                solution = _construct_node(loader, loader.get_event(), anchors)
+                # The constructor remembers every node it built, forget them to keep memory bounded.
+                loader.constructed_objects.clear()
+                yield solution
+        finally:
+            loader.dispose()
+
+
+def _skip_node(loader, anchors):
+    # Skips the value node following a key that is not of interest, except for anchored values within it.
+    event = loader.get_event()
+    if isinstance(event, (yaml.ScalarEvent, yaml.MappingStartEvent, yaml.SequenceStartEvent)) and event.anchor:
+        _construct_node(loader, event, anchors)
+    elif isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+        while not loader.check_event(yaml.MappingEndEvent, yaml.SequenceEndEvent):
+            _skip_node(loader, anchors)
+        loader.get_event()
+
+
+def _construct_node(loader, event, anchors):
+    # Builds one value from its parser events, resolving scalars, aliases and merge keys like the safe loader does.
+    if isinstance(event, yaml.AliasEvent):
+        if event.anchor not in anchors:
+            raise Exception("Error reading population file: undefined alias {alias_}!".format(alias_=event.anchor))
+        return anchors[event.anchor]
+    if isinstance(event, yaml.ScalarEvent):
+        value = loader.construct_object(yaml.ScalarNode(_resolve_tag(loader, event), event.value, style=event.style),
+                                        deep=True)
+    elif isinstance(event, yaml.SequenceStartEvent):
+        value = []
+        while not loader.check_event(yaml.SequenceEndEvent):
+            value.append(_construct_node(loader, loader.get_event(), anchors))
+        loader.get_event()
+    elif isinstance(event, yaml.MappingStartEvent):
+        value = {}
+        merged = {}
+        while not loader.check_event(yaml.MappingEndEvent):
+            key_event = loader.get_event()
+            if isinstance(key_event, yaml.ScalarEvent) and _resolve_tag(loader, key_event) == MERGE_TAG:
+                # Merged mappings fill in the keys not given explicitly, earlier ones taking precedence.
+                merge_value = _construct_node(loader, loader.get_event(), anchors)
+                for merge_mapping in merge_value if isinstance(merge_value, list) else [merge_value]:
+                    for key, item in merge_mapping.items():
+                        merged.setdefault(key, item)
+                continue
+            key = _construct_node(loader, key_event, anchors)
+            value[key] = _construct_node(loader, loader.get_event(), anchors)
+        loader.get_event()
+        if merged:
+            merged.update(value)
+            value = merged
+    else:
+        raise Exception("Error reading population file: unsupported YAML element {event_}!".format(event_=event))
+
+    if event.anchor is not None:
+        anchors[event.anchor] = value
+    return value
+
+
+def _resolve_tag(loader, event):
+    if event.tag is None or event.tag == "!":
+        return loader.resolve(yaml.ScalarNode, event.value, event.implicit)
+    return event.tag
@@ -0,0 +1,129 @@
+import numpy
+
+from population.individual import DEFAULT_FITNESS, Individual
+
+
+class Population(object):
+    # Stores the fitness of all individuals in one contiguous float array with the solutions in a parallel list.
+    # Individuals are only materialized as slotted views when they are accessed one by one.
+    __slots__ = ("fitness", "solutions")
+
+    def __init__(self, individuals=None):
+        solutions = []
+        fitness = []
+        for individual in individuals or []:
+            solutions.append(individual.solution)
+            fitness.append(individual.fitness)
+        self.solutions = solutions
+        self.fitness = numpy.array(fitness, dtype=numpy.float64)
+
+    @classmethod
+    def from_columns(cls, solutions, fitness):
+        population = cls.__new__(cls)
+        population.solutions = list(solutions)
+        population.fitness = numpy.asarray(fitness, dtype=numpy.float64)
+        return population
+
+    def __len__(self):
+        return self.solutions.__len__()
+
+    def __iter__(self):
+        for solution, fitness in zip(self.solutions, self.fitness.tolist()):
+            yield Individual(solution, fitness)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Population.from_columns(self.solutions[index], self.fitness[index])
+        return Individual(self.solutions[index], float(self.fitness[index]))
+
+    def __add__(self, other):
+        if not isinstance(other, Population):
+            other = Population(other)
+        return Population.from_columns(
+            self.solutions + other.solutions,
+            numpy.concatenate((self.fitness, other.fitness)),
+        )
+
+    def __repr__(self):
+        return "Population({amount_} individuals)".format(amount_=self.__len__())
+
+    def take(self, indices):
+        # Returns a new population holding the individuals at the given indices, in that order.
+        solutions = self.solutions
+        return Population.from_columns([solutions[i] for i in indices.tolist()], self.fitness[indices])
+
+    def sorted(self):
+        # Sorts by fitness in descending order (fittest first), keeping the order of equally fit individuals.
+        return self.take(numpy.argsort(-self.fitness, kind="stable"))
+
+    def top_k(self, k):
+        # Returns the k fittest individuals, fittest first, without sorting the whole population.
+        if k >= self.__len__():
+            return self.sorted()
+        if k <= 0:
+            return Population()
+        candidates = numpy.sort(numpy.argpartition(-self.fitness, k - 1)[:k])
+        return self.take(candidates[numpy.argsort(-self.fitness[candidates], kind="stable")])
+
+    def sample(self, k, rng):
+        # Returns k distinct individuals drawn at random with the given random.Random instance.
+        k = min(k, self.__len__())
+        return self.take(numpy.array(rng.sample(range(self.__len__()), k), dtype=numpy.intp))
+
+    def split(self, parts):
+        # Deals the individuals round robin into the given amount of parts,
+        # so every part of a sorted population spans the whole fitness range.
+        parts = max(1, min(parts, self.__len__()))
+        return [self.take(numpy.arange(part, self.__len__(), parts)) for part in range(parts)]
+
+    def elite(self, elite_portion):
+        # Assumes a population sorted by fitness.
+        return self[:elite_portion]
+
+    def stats(self):
+        if self.__len__() == 0:
+            return {"size": 0, "best": None, "worst": None, "mean": None, "stdev": None}
+        fitness = self.fitness
+        return {
+            "size": self.__len__(),
+            "best": float(fitness.max()),
+            "worst": float(fitness.min()),
+            "mean": float(fitness.mean()),
+            "stdev": float(fitness.std()),
+        }
+
+    def to_list(self):
+        return [{"solution": solution, "fitness": fitness}
+                for solution, fitness in zip(self.solutions, self.fitness.tolist())]
+
+
+class PopulationBuffer(object):
+    # Collects individuals one message at a time, appending to plain lists until turned into a Population.
+    __slots__ = ("fitness", "solutions")
+
+    def __init__(self):
+        self.solutions = []
+        self.fitness = []
+
+    def __len__(self):
+        return self.solutions.__len__()
+
+    def add(self, solution, fitness=None):
+        self.solutions.append(solution)
+        self.fitness.append(fitness if fitness else DEFAULT_FITNESS)
+
+    def extend(self, individuals):
+        if isinstance(individuals, (Population, PopulationBuffer)):
+            self.solutions.extend(individuals.solutions)
+            self.fitness.extend(individuals.fitness)
+        else:
+            for individual in individuals:
+                self.add(individual.solution, individual.fitness)
+
+    def truncate(self, length):
+        # Drops the individuals collected after the first length ones.
+        del self.solutions[length:]
+        del self.fitness[length:]
+
+    def to_population(self):
+        return Population.from_columns(self.solutions, self.fitness)
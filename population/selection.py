@@ -0,0 +1,78 @@
+import numpy
+
+from population.fitness_cache import solution_key
+from population.population import Population
+
+# Survivor selection strategies, chosen by the SELECTION_STRATEGY property.
+TRUNCATION = "truncation"
+TOURNAMENT = "tournament"
+MU_PLUS_LAMBDA = "plus"
+MU_COMMA_LAMBDA = "comma"
+DIVERSE_TRUNCATION = "diverse"
+DEFAULT_TOURNAMENT_SIZE = 2
+
+
+def merge_sorted(*runs):
+    # Merges populations that are each sorted by fitness, fittest first, keeping earlier runs first on ties.
+    # The stable sort is a timsort, which finds the runs and merges them in linear time instead of sorting anew.
+    runs = [run for run in runs if run.__len__() > 0]
+    if runs.__len__() == 0:
+        return Population()
+    if runs.__len__() == 1:
+        return runs[0]
+    solutions = []
+    for run in runs:
+        solutions.extend(run.solutions)
+    fitness = numpy.concatenate([run.fitness for run in runs])
+    order = numpy.argsort(-fitness, kind="stable")
+    return Population.from_columns([solutions[i] for i in order.tolist()], fitness[order])
+
+
+def tournament(candidates, size, rng, tournament_size=DEFAULT_TOURNAMENT_SIZE):
+    # Fills size places with the winners of tournaments among tournament_size candidates drawn at random.
+    # The numpy generator is seeded from rng, so checkpointed runs select alike when resumed.
+    if size <= 0 or candidates.__len__() == 0:
+        return Population()
+    generator = numpy.random.default_rng(rng.getrandbits(64))
+    contestants = generator.integers(0, candidates.__len__(), size=(size, max(1, tournament_size)))
+    winners = contestants[numpy.arange(size), numpy.argmax(candidates.fitness[contestants], axis=1)]
+    return candidates.take(winners).sorted()
+
+
+def diverse_truncation(sorted_candidates, size):
+    # Truncation that takes every solution only once, duplicates only fill places left over.
+    selected = []
+    duplicates = []
+    seen = set()
+    for index, solution in enumerate(sorted_candidates.solutions):
+        key = solution_key(solution)
+        if key in seen:
+            duplicates.append(index)
+        else:
+            seen.add(key)
+            selected.append(index)
+            if selected.__len__() >= size:
+                break
+    indices = selected + duplicates[:max(0, size - selected.__len__())]
+    return sorted_candidates.take(numpy.array(sorted(indices), dtype=numpy.intp))
+
+
+def select_survivors(strategy, parents, elite, offspring, size, rng, tournament_size=DEFAULT_TOURNAMENT_SIZE):
+    # parents, elite and offspring are sorted by fitness, fittest first, as are the returned survivors.
+    # truncation: the fittest of elite and offspring, (mu+lambda): the fittest of parents and offspring,
+    # (mu,lambda): the fittest offspring only, tournament: the elite plus tournament winners among elite
+    # and offspring, diverse: truncation taking every solution only once while others are left.
+    # The vectorized merge outruns the heap based selections in Python, see benchmarks.selection.
+    if strategy is None or strategy == TRUNCATION:
+        return merge_sorted(elite, offspring)[:size]
+    if strategy == MU_PLUS_LAMBDA:
+        return merge_sorted(parents, offspring)[:size]
+    if strategy == MU_COMMA_LAMBDA:
+        return offspring[:size]
+    if strategy == TOURNAMENT:
+        candidates = merge_sorted(elite, offspring)
+        winners = tournament(candidates, size - elite.__len__(), rng, tournament_size)
+        return merge_sorted(elite, winners)
+    if strategy == DIVERSE_TRUNCATION:
+        return diverse_truncation(merge_sorted(elite, offspring), size)
+    raise Exception("No valid selection strategy '{name_}' defined!".format(name_=strategy))
@@ -1,28 +1,63 @@
+import asyncio
+import atexit
 import json
 import logging
-import math
+import os
+import random
+import re
+import signal
+import sys
+import threading
 import time
-import warnings
+from concurrent.futures import ThreadPoolExecutor
 
-from flask import Flask, make_response, jsonify
+from flask import Flask, Response, make_response, jsonify, request
 
 from database_handler.handlers import DatabaseHandlers
+from database_handler import redis_handler
 from database_handler.redis_handler import RedisHandler
+from database_handler.write_behind import WriteBehindPersister
 from message_handler.handlers import MessageHandlers
+from message_handler.message_handler import GENERATION_HEADER
+from message_handler.local_process_pool import LocalProcessPool
+from message_handler import rabbit_message_queue
 from message_handler.rabbit_message_queue import RabbitMessageQueue
+from population.fitness_cache import FitnessCache, DEFAULT_CACHE_SIZE
 from population.individual import Individual, IndividualEncoder
-from utilities import utils
+from population.loader import iter_batches, iter_solutions, DEFAULT_LOAD_BATCH_SIZE, JSON_LINES_EXTENSIONS
+from runner.async_runtime import run_pga_async, ASYNCIO
+from runner.generational import GenerationalRun, get_receive_settings, prepare_initial_population, \
+    resume_from_checkpoint, GENERATIONAL
+from runner.islands import run_islands, ISLANDS, STAGES_PASS_HEADERS, TOPOLOGY_RING
+from runner.pga_run import PgaRun, FAILED
+from runner.steady_state import run_steady_state, STEADY_STATE
+from utilities import metrics, utils
+from utilities.handler_pool import HandlerPool
+from utilities.history import GenerationHistory, DEFAULT_HISTORY_PAGE_SIZE, MAX_HISTORY_PAGE_SIZE
+from utilities.properties import get_flag
+from utilities.run_context import get_run_context, reset_run_context
 
 logging.basicConfig(level=logging.INFO)
 
 WAIT_FOR_TERMINATION = 60  # seconds
+MAX_PGA_WORKERS = 4
 
 DATABASE_HANDLER = DatabaseHandlers.Redis
 MESSAGE_HANDLER = MessageHandlers.RabbitMQ
-RELEVANT_PROPERTIES = ["POPULATION_SIZE", "ELITISM_RATE"]
+RELEVANT_PROPERTIES = ["POPULATION_SIZE", "ELITISM_RATE", "RECEIVE_PREFETCH", "MESSAGE_CODEC", "MESSAGE_COMPRESSION",
+                       "RELEASE_SHARDS", "RELEASE_SHARD_BYTES"]
+DEFAULT_INIT_BATCH_SIZE = 1
+# Cursors of the history endpoint are the entry ids of the history stream.
+HISTORY_CURSOR = re.compile(r"^\d+-\d+$")
 
-__ABORTING = False
-__FINISHED = False
+DEFAULT_ISLAND_COUNT = 4
+DEFAULT_MIGRATION_INTERVAL = 5
+DEFAULT_MIGRATION_RATE = 0.1
+
+# PGAs are executed on a managed background executor, their run handles are kept by pga_id.
+__EXECUTOR = ThreadPoolExecutor(max_workers=MAX_PGA_WORKERS, thread_name_prefix="pga")
+__RUNS = {}
+__RUNS_LOCK = threading.Lock()
 
 
 # App initialization.
@@ -34,14 +69,38 @@ def status():
     return "OK"
 
 
+@rnr.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    # Counters, fitness gauges and phase timings of all PGAs in the Prometheus text format.
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@rnr.route("/<int:pga_id>/health", methods=["GET"])
+def pga_health(pga_id):
+    health = {
+        "database": is_healthy(__DATABASE_HANDLERS, probe_database, pga_id),
+        "messaging": is_healthy(__MESSAGE_HANDLERS, probe_messaging, pga_id),
+    }
+    return make_response(jsonify(health), 200 if all(health.values()) else 503)
+
+
+def is_healthy(handler_pool, probe, pga_id):
+    # Checks the pooled handler of the PGA, or probes its service once if there is none yet,
+    # so health checks never wait for a handler connecting with retries.
+    try:
+        handler = handler_pool.peek(pga_id)
+        if handler is None:
+            return probe(pga_id)
+        return handler.is_healthy()
+    except Exception:
+        logging.exception("Health check of PGA {id_} failed.".format(id_=pga_id))
+        return False
+
+
 @rnr.route("/<int:pga_id>/properties", methods=["PUT"])
 def init_properties(pga_id):
     # Prepare properties to store.
-    properties_dict = utils.parse_yaml("/{id_}{sep_}config.yml".format(
-                id_=pga_id,
-                sep_=utils.PGA_NAME_SEPARATOR
-            )
-        ).get("properties")
+    properties_dict = dict(utils.get_pga_config(pga_id).get("properties"))
 
     logging.info("Appending pga_id {id_} to properties.".format(id_=pga_id))
     properties_dict["PGAcloud_pga_id"] = pga_id
@@ -57,10 +116,7 @@ def init_properties(pga_id):
 
 @rnr.route("/<int:pga_id>/population", methods=["POST"])
 def init_population(pga_id):
-    config_dict = utils.parse_yaml("/{id_}{sep_}config.yml".format(
-        id_=pga_id,
-        sep_=utils.PGA_NAME_SEPARATOR
-    ))
+    config_dict = utils.get_pga_config(pga_id)
 
     use_initial_population = config_dict.get("population").get("use_initial_population")
     generate_population = False
@@ -73,208 +129,473 @@ def init_population(pga_id):
 
     if generate_population:
         total_pop_size = config_dict.get("properties").get("POPULATION_SIZE")
+        init_batch_size = config_dict.get("properties").get("INIT_BATCH_SIZE", DEFAULT_INIT_BATCH_SIZE)
         # generate at least as many individuals as required
         # if population size exceeds the POPULATION_SIZE property, the population will be cropped when starting the PGA
 
         logging.info("Delegating generating {size_} individuals.".format(
             size_=total_pop_size,
         ))
-        message_handler.send_multiple_to_init(individuals_amount=total_pop_size)
+        message_handler.send_multiple_to_init(individuals_amount=total_pop_size, batch_size=init_batch_size)
     else:
-        # Read and parse provided population.
-        population_dict = utils.parse_yaml("/{id_}--population.yml".format(id_=pga_id))
-        solutions = population_dict.get("individuals")
-        population = []
-        for solution in solutions:
-            population.append(Individual(solution))
-
-        # Send individuals to fitness evaluation.
-        next_recipient = utils.get_messaging_init_eval()
-        for individual in population:
-            message_handler.send_message(individuals=individual, next_recipient=next_recipient)
-
-        # Store current population.
+        # Stream the provided population in batches, so memory stays bounded by the load batch size.
+        init_batch_size = max(1, config_dict.get("properties").get("INIT_BATCH_SIZE", DEFAULT_INIT_BATCH_SIZE))
+        load_batch_size = config_dict.get("properties").get("POPULATION_LOAD_BATCH_SIZE", DEFAULT_LOAD_BATCH_SIZE)
+        population_path = get_population_path(pga_id)
         database_handler = get_database_handler(pga_id)
-        database_handler.store_population(population)
+        fitness_cache = get_fitness_cache(pga_id, config_dict.get("properties"), database_handler)
+        next_recipient = utils.get_messaging_init_eval(pga_id)
+        counts = {"total": 0, "known": 0}
+
+        def release_batches():
+            for solutions in iter_batches(iter_solutions(population_path), load_batch_size):
+                # Look up solutions evaluated before, these skip the fitness evaluation.
+                individuals = []
+                unknown_individuals = []
+                known_individuals = []
+                for solution, fitness in zip(solutions, fitness_cache.lookup(solutions)):
+                    individual = Individual(solution, fitness)
+                    individuals.append(individual)
+                    if fitness is None:
+                        unknown_individuals.append(individual)
+                    else:
+                        known_individuals.append(individual)
+
+                # Send individuals to fitness evaluation in messages of INIT_BATCH_SIZE individuals,
+                # known individuals are returned to the runner right away.
+                for start in range(0, unknown_individuals.__len__(), init_batch_size):
+                    message_handler.send_message(
+                        individuals=unknown_individuals[start] if init_batch_size == 1
+                        else unknown_individuals[start:start + init_batch_size],
+                        next_recipient=next_recipient,
+                    )
+                if known_individuals.__len__() > 0:
+                    message_handler.send_message(
+                        individuals=known_individuals,
+                        next_recipient=utils.get_messaging_source(pga_id),
+                    )
+                counts["total"] += individuals.__len__()
+                counts["known"] += known_individuals.__len__()
+                yield individuals
+
+        # Store current population while releasing it.
+        database_handler.store_population_chunks(release_batches())
+        logging.info("Released {total_} provided individuals, fitness of {known_} already known.".format(
+            total_=counts["total"],
+            known_=counts["known"],
+        ))
 
     return make_response(jsonify(None), 201)
 
 
 @rnr.route("/<int:pga_id>/start", methods=["PUT"])
 def start_pga(pga_id):
-    population = run_pga(pga_id)
-    fittest = stop_pga(pga_id, population)
+    # Refuse island runs before releasing anything, unless their individuals can be told apart on return.
+    properties = utils.get_pga_config(pga_id).get("properties")
+    if (properties.get("GENERATION_MODE", GENERATIONAL) == ISLANDS and MESSAGE_HANDLER != MessageHandlers.Local
+            and not get_flag(properties, STAGES_PASS_HEADERS)):
+        return make_response(jsonify({
+            "id": pga_id,
+            "error": "Island mode requires the model and evaluation stages to pass message headers on, "
+                     "set {prop_} if they do!".format(prop_=STAGES_PASS_HEADERS),
+        }), 400)
+
+    with __RUNS_LOCK:
+        pga_run = __RUNS.get(pga_id)
+        if pga_run is not None and pga_run.is_running():
+            return make_response(jsonify(pga_run.to_status()), 409)
+
+        # Reset the run context, then run the generations in the background and return the run handle.
+        reset_run_context(pga_id)
+        pga_run = PgaRun(pga_id)
+        __RUNS[pga_id] = pga_run
+    resume = request.args.get("resume", "false").lower() in ["1", "true", "yes"]
+    __EXECUTOR.submit(execute_pga, pga_id, pga_run, resume)
+
+    response = make_response(jsonify(pga_run.to_status()), 202)
+    response.headers["Location"] = "/{id_}/status".format(id_=pga_id)
+    return response
+
+
+@rnr.route("/<int:pga_id>/status", methods=["GET"])
+def pga_status(pga_id):
+    pga_run = __RUNS.get(pga_id)
+    if pga_run is None:
+        return make_response(jsonify(None), 404)
+    return make_response(jsonify(pga_run.to_status()), 200)
+
+
+@rnr.route("/<int:pga_id>/progress", methods=["GET"])
+def pga_progress(pga_id):
+    pga_run = __RUNS.get(pga_id)
+    if pga_run is None:
+        return make_response(jsonify(None), 404)
+    return make_response(jsonify(pga_run.get_progress()), 200)
+
+
+@rnr.route("/<int:pga_id>/history", methods=["GET"])
+def pga_history(pga_id):
+    # Pages through the generation summaries in order, the next cursor continues behind the last summary returned.
+    after = request.args.get("after")
+    if after is not None and HISTORY_CURSOR.match(after) is None:
+        return make_response(jsonify({
+            "id": pga_id,
+            "error": "Invalid history cursor '{after_}'!".format(after_=after),
+        }), 400)
+    count = min(max(1, request.args.get("count", DEFAULT_HISTORY_PAGE_SIZE, type=int)), MAX_HISTORY_PAGE_SIZE)
+    entries = get_database_handler(pga_id).retrieve_history(after=after, count=count)
+    return make_response(jsonify({
+        "id": pga_id,
+        "history": [summary for _, summary in entries],
+        "next": entries[-1][0] if entries.__len__() == count else None,
+    }), 200)
+
+
+@rnr.route("/<int:pga_id>/result", methods=["GET"])
+def pga_result(pga_id):
+    pga_run = __RUNS.get(pga_id)
+    if pga_run is None:
+        return make_response(jsonify(None), 404)
+    if pga_run.is_running():
+        return make_response(jsonify(pga_run.to_status()), 202)
+    if pga_run.state == FAILED:
+        return make_response(jsonify({
+            "id": pga_id,
+            "error": pga_run.error,
+        }), 500)
 
     return make_response(jsonify({
         "id": pga_id,
-        "fittest": json.dumps(fittest, cls=IndividualEncoder)
+        "fittest": json.dumps(pga_run.fittest, cls=IndividualEncoder)
     }), 200)
 
 
 @rnr.route("/stop", methods=["PUT"])
 def abort_pga():
-    global __ABORTING
-    __ABORTING = True
-    timer = 0
-    start = time.perf_counter()
-
-    global __FINISHED
-    while not __FINISHED and timer < WAIT_FOR_TERMINATION:
-        time.sleep(1)
-        timer = time.perf_counter() - start
+    # Signal all running PGAs to abort.
+    with __RUNS_LOCK:
+        running = [pga_run for pga_run in __RUNS.values() if pga_run.is_running()]
+    abort_runs(running)
     return make_response(jsonify(None), 202)
 
 
-def run_pga(pga_id):
+@rnr.route("/<int:pga_id>/stop", methods=["PUT"])
+def abort_single_pga(pga_id):
+    pga_run = __RUNS.get(pga_id)
+    if pga_run is None:
+        return make_response(jsonify(None), 404)
+    abort_runs([pga_run])
+    return make_response(jsonify(pga_run.to_status()), 202)
+
+
+def abort_runs(pga_runs):
+    # Signal the given PGAs to abort, then wait for them to terminate.
+    for pga_run in pga_runs:
+        pga_run.request_abort()
+
+    deadline = time.perf_counter() + WAIT_FOR_TERMINATION
+    for pga_run in pga_runs:
+        pga_run.wait(timeout=max(0, deadline - time.perf_counter()))
+
+
+def execute_pga(pga_id, pga_run, resume):
+    # Runs once a worker of the executor is free, unless the run was aborted while queued.
+    if not pga_run.start():
+        return
+    try:
+        population = run_pga(pga_id, pga_run, resume)
+        fittest = stop_pga(pga_id, population)
+        pga_run.finish(fittest)
+    except Exception as e:
+        logging.exception("PGA {id_} failed.".format(id_=pga_id))
+        pga_run.fail(e)
+
+
+def run_pga(pga_id, pga_run, resume=False):
+    # Run generational PGAs on the asyncio runtime if RUNTIME is set to asyncio.
+    database_handler = get_database_handler(pga_id)
+    properties = utils.get_pga_config(pga_id).get("properties")
+    if properties.get("RUNTIME") == ASYNCIO:
+        if properties.get("GENERATION_MODE", GENERATIONAL) != GENERATIONAL:
+            raise Exception("The asyncio runtime only runs generational PGAs!")
+        fitness_cache = get_fitness_cache(pga_id, properties, database_handler)
+        return asyncio.run(run_pga_async(pga_id, pga_run, resume, RELEVANT_PROPERTIES, fitness_cache))
+
+    # Persist generations on a background thread unless WRITE_BEHIND is disabled.
+    # Everything queued is written before the run returns, also when aborted or failed.
+    if not get_flag(properties, "WRITE_BEHIND", True):
+        return evolve_pga(pga_id, pga_run, resume, database_handler)
+    persister = WriteBehindPersister(pga_id, database_handler)
+    try:
+        return evolve_pga(pga_id, pga_run, resume, persister)
+    finally:
+        persister.close()
+
+
+def evolve_pga(pga_id, pga_run, resume, population_store):
     # Get support handlers.
     database_handler = get_database_handler(pga_id)
     message_handler = get_message_handler(pga_id)
 
-    # Collect termination criteria.
-    config_dict = utils.parse_yaml("/{id_}{sep_}config.yml".format(
-        id_=pga_id,
-        sep_=utils.PGA_NAME_SEPARATOR
-    ))
-    max_generations = config_dict.get("properties").get("MAX_GENERATIONS")
-    max_unimproved_generations = config_dict.get("properties").get("MAX_UNIMPROVED_GENERATIONS")
-    max_time_seconds = config_dict.get("properties").get("MAX_TIME_SECONDS")
+    # Collect termination criteria and generation deadline settings.
+    config_dict = utils.get_pga_config(pga_id)
+    properties = config_dict.get("properties")
+    max_generations = properties.get("MAX_GENERATIONS")
+    max_unimproved_generations = properties.get("MAX_UNIMPROVED_GENERATIONS")
+    max_time_seconds = properties.get("MAX_TIME_SECONDS")
+    receive_settings = get_receive_settings(properties, pga_run)
 
     # Set relevant properties.
-    for prop in RELEVANT_PROPERTIES:
-        value = database_handler.retrieve_item(prop)
-        utils.set_property(prop, value)
-    elitism_rate = float(utils.get_property("ELITISM_RATE"))
-
-    # Initialize population and settings.
-    logging.info("Collecting evaluated initial population.")
-    message_handler.receive_messages()
-    population = utils.collect_and_reset_received_individuals()
-
-    # Crop population if too large.
-    population_size = int(utils.get_property("POPULATION_SIZE"))
-    if population.__len__() > population_size:
-        warnings.warn("Population too large! Expected {exp_} - Actual {act_}".format(
-            exp_=population_size,
-            act_=population.__len__()
-        ))
-        logging.info("Cropping population to defined size.")
-        population = population[:population_size]
-    elif population.__len__() < population_size:
-        warnings.warn("Population not large enough! Expected {exp_} - Actual {act_}".format(
-            exp_=population_size,
-            act_=population.__len__()
-        ))
-
-    # Prepare generation handling.
-    generations_done = 0
-    unimproved_generations = 0
-    pga_runtime = 0
-    pga_start_time = time.perf_counter()
+    utils.set_properties(pga_id, database_handler.retrieve_items(RELEVANT_PROPERTIES))
+    elitism_rate = utils.get_property(pga_id, "ELITISM_RATE")
+
+    population_size = utils.get_property(pga_id, "POPULATION_SIZE")
+    fitness_cache = get_fitness_cache(pga_id, properties, database_handler)
+    rng = random.Random()
+
+    # Continue from the last complete generation if requested, without re-evaluating its population.
+    checkpoint = None
+    if resume:
+        checkpoint, population = database_handler.retrieve_checkpoint()
+        resume_from_checkpoint(pga_id, checkpoint, population, rng, fitness_cache)
+
+    receipt = None
+    if checkpoint is None:
+        # Initialize population and settings, the history of an earlier run does not continue.
+        database_handler.clear_history()
+        logging.info("Collecting evaluated initial population.")
+        receipt = message_handler.receive_messages(generation=0, **receive_settings)
+        population = prepare_initial_population(pga_id, population_size, pga_run, fitness_cache)
+        checkpoint = {}
+
+    # Record a summary of every finished generation unless RECORD_HISTORY is disabled.
+    history = GenerationHistory.from_properties(pga_id, properties)
+
+    # Evolve without generational barrier if configured.
+    generation_mode = properties.get("GENERATION_MODE", GENERATIONAL)
+    if generation_mode != GENERATIONAL:
+        # These modes keep receiving without generational barrier, acknowledging messages as they arrive.
+        message_handler.acknowledge(receipt)
+    if generation_mode == STEADY_STATE:
+        return run_steady_state(
+            pga_id=pga_id,
+            pga_run=pga_run,
+            population=population,
+            population_size=population_size,
+            release_size=properties.get("STEADY_STATE_RELEASE_SIZE", max(1, population_size // 10)),
+            termination={
+                "max_evaluations": properties.get("MAX_EVALUATIONS", max_generations * population_size),
+                "max_unimproved_evaluations": max_unimproved_generations * population_size,
+                "max_time_seconds": max_time_seconds,
+            },
+            database_handler=population_store,
+            message_handler=message_handler,
+            rng=rng,
+            checkpoint=checkpoint,
+            history=history,
+        )
+    if generation_mode == ISLANDS:
+        return run_islands(
+            pga_id=pga_id,
+            pga_run=pga_run,
+            population=population,
+            population_size=population_size,
+            island_count=properties.get("ISLAND_COUNT", DEFAULT_ISLAND_COUNT),
+            elitism_rate=elitism_rate,
+            migration={
+                "interval": properties.get("MIGRATION_INTERVAL", DEFAULT_MIGRATION_INTERVAL),
+                "rate": properties.get("MIGRATION_RATE", DEFAULT_MIGRATION_RATE),
+                "topology": properties.get("MIGRATION_TOPOLOGY", TOPOLOGY_RING),
+            },
+            termination={
+                "max_generations": max_generations,
+                "max_unimproved_generations": max_unimproved_generations,
+                "max_time_seconds": max_time_seconds,
+            },
+            receive_settings=receive_settings,
+            database_handler=population_store,
+            message_handler=message_handler,
+            rng=rng,
+            checkpoint=checkpoint,
+            history=history,
+        )
 
     # Run generations.
-    while (generations_done < max_generations
-           and unimproved_generations < max_unimproved_generations
-           and pga_runtime < max_time_seconds):
-        logging.info("Starting new generation: {gen_}".format(gen_=generations_done+1))
-
-        # Store population in database.
-        database_handler.store_population(population)
-        old_fittest = population[0]
+    generational_run = GenerationalRun(
+        pga_id=pga_id,
+        pga_run=pga_run,
+        properties=properties,
+        population=population,
+        population_size=population_size,
+        elitism_rate=elitism_rate,
+        fitness_cache=fitness_cache,
+        rng=rng,
+        checkpoint=checkpoint,
+        history=history,
+    )
+    next_recipient = utils.get_messaging_pga(pga_id)
+    while True:
+        # Store population in database, checkpointing the run state of the last complete generation with it,
+        # also once the run is complete. The messages it was received in are acknowledged once it is persisted.
+        with metrics.span(pga_id, "store"):
+            store_generation(population_store, message_handler, generational_run, receipt)
+        if not generational_run.is_running():
+            break
 
         # Check if an abort request was issued.
-        if __ABORTING:
+        if pga_run.is_aborting():
             logging.info("ATTENTION: Aborting PGA!")
             break
 
-        # Apply elitism. Ensure at least the very best individual is transferred to the next generation.
-        logging.info("Applying elitism to current population.")
-        elite_portion = math.floor(population.__len__() * elitism_rate)
-        if not elite_portion > 0:
-            elite_portion = 1
-        elite = population[:elite_portion]
-
-        # Release entire population to model.
-        logging.info("Releasing population to model.")
-        next_recipient = utils.get_messaging_pga()
-        message_handler.send_message(individuals=population, next_recipient=next_recipient)
-
-        # Listen to FE queue.
-        message_handler.receive_messages()
-        new_individuals = utils.collect_and_reset_received_individuals()
-
-        # Crop new population if too large.
-        if new_individuals.__len__() > population_size:
-            warnings.warn("Cropping oversized population! Expected {exp_} - Actual {act_}".format(
-                exp_=population_size,
-                act_=new_individuals.__len__()
-            ))
-            new_individuals = new_individuals[:population_size]
-        elif new_individuals.__len__() < population_size:
-            warnings.warn("Population not large enough! Expected {exp_} - Actual {act_}".format(
-                exp_=population_size,
-                act_=new_individuals.__len__()
-            ))
-
-        # Combine elite and returning individuals, sort by fitness.
-        logging.info("Sorting population.")
-        sorted_population = utils.sort_population_by_fitness(elite + new_individuals)
-
-        # Apply survival selection.
-        logging.info("Applying survival selection to population.")
-        population = select_survivors(sorted_population, elite_portion)
-
-        # Finish generation.
-        generations_done += 1
-        if old_fittest.fitness >= population[0].fitness:
-            unimproved_generations += 1
-            logging.info("Finished generation #{gen_} - unimproved #{unimp_}.".format(
-                gen_=generations_done,
-                unimp_=unimproved_generations,
-            ))
-        else:
-            unimproved_generations = 0
-            logging.info("Finished generation #{gen_} - improved individuals.".format(gen_=generations_done))
-        pga_runtime = time.perf_counter() - pga_start_time
-
-    return population
+        generation = generational_run.generations_done + 1
+        logging.info("Starting new generation: {gen_}".format(gen_=generation))
 
+        # Release population to model and listen to FE queue.
+        released = generational_run.start_generation()
+        with metrics.span(pga_id, "release"):
+            message_handler.send_message(
+                individuals=released,
+                next_recipient=next_recipient,
+                headers={GENERATION_HEADER: generation},
+            )
+        with metrics.span(pga_id, "wait"):
+            receipt = message_handler.receive_messages(generation=generation, **receive_settings)
+        with metrics.span(pga_id, "sort"):
+            new_individuals = utils.collect_and_reset_received_individuals(pga_id)
+
+        # An abort ends the wait early, the unfinished generation is neither selected nor recorded,
+        # its individuals are returned to the queue.
+        if pga_run.is_aborting():
+            logging.info("ATTENTION: Aborting PGA!")
+            message_handler.requeue(receipt)
+            break
+        generational_run.record_offspring(new_individuals)
 
-def stop_pga(pga_id, population):
-    # Get support handlers.
-    database_handler = get_database_handler(pga_id)
+        # Select the next population and finish generation.
+        summary = generational_run.finish_generation(new_individuals)
+        if summary is not None:
+            population_store.store_summary(summary)
 
-    # Store population and determine fittest individual.
+    return generational_run.population
+
+
+def store_generation(population_store, message_handler, generational_run, receipt):
+    # Acknowledge the messages of a generation only once it is persisted, so the broker redelivers them
+    # if the runner fails before. The write-behind persister acknowledges them once it has written the snapshot.
+    population = generational_run.population
+    checkpoint = generational_run.get_checkpoint()
+    if isinstance(population_store, WriteBehindPersister):
+        population_store.store_population(population, checkpoint=checkpoint,
+                                          on_persisted=lambda: message_handler.acknowledge(receipt))
+    else:
+        population_store.store_population(population, checkpoint=checkpoint)
+        message_handler.acknowledge(receipt)
+
+
+def stop_pga(pga_id, population):
+    # Determine fittest individual. The final population is stored with its checkpoint by the run already.
     sorted_population = utils.sort_population_by_fitness(population)
-    logging.info("Storing final population with {amount_} individuals.".format(amount_=sorted_population.__len__()))
-    database_handler.store_population(sorted_population)
+    if sorted_population.__len__() == 0:
+        logging.info("Terminating PGA without any evaluated individuals.")
+        return None
     fittest = sorted_population[0]
 
     logging.info("Terminating PGA. Fittest individual: fit={fit_}, sol={sol_}".format(
         fit_=fittest.fitness,
         sol_=fittest.solution,
     ))
-    global __FINISHED
-    __FINISHED = True
     return fittest
 
 
-def select_survivors(sorted_population, kill_portion):
-    return sorted_population[:-kill_portion]  # fittest first, so remove at back end.
+def get_population_path(pga_id):
+    # A provided population is read from JSON Lines if given as such, else from YAML.
+    for extension in JSON_LINES_EXTENSIONS:
+        population_path = "/{id_}--population{ext_}".format(id_=pga_id, ext_=extension)
+        if os.path.isfile(population_path):
+            return population_path
+    return "/{id_}--population.yml".format(id_=pga_id)
 
 
-def get_database_handler(pga_id):
+def get_fitness_cache(pga_id, properties, database_handler):
+    # The fitness cache lives in the run context, shared through the database if FITNESS_CACHE_SHARED is set.
+    context = get_run_context(pga_id)
+    with context.lock:
+        if context.fitness_cache is None:
+            context.fitness_cache = FitnessCache(
+                capacity=int(properties.get("FITNESS_CACHE_SIZE", DEFAULT_CACHE_SIZE)),
+                database_handler=database_handler if get_flag(properties, "FITNESS_CACHE_SHARED") else None,
+            )
+        return context.fitness_cache
+
+
+def create_database_handler(pga_id):
     if DATABASE_HANDLER == DatabaseHandlers.Redis:
         return RedisHandler(pga_id)
     else:
         raise Exception("No valid DatabaseHandler defined!")
 
 
-def get_message_handler(pga_id):
+def probe_database(pga_id):
+    if DATABASE_HANDLER == DatabaseHandlers.Redis:
+        return redis_handler.probe(pga_id)
+    else:
+        raise Exception("No valid DatabaseHandler defined!")
+
+
+def probe_messaging(pga_id):
+    # The local process pool depends on no service.
+    if MESSAGE_HANDLER == MessageHandlers.RabbitMQ:
+        return rabbit_message_queue.probe(pga_id)
+    elif MESSAGE_HANDLER == MessageHandlers.Local:
+        return True
+    else:
+        raise Exception("No valid MessageHandler defined!")
+
+
+def create_message_handler(pga_id):
     if MESSAGE_HANDLER == MessageHandlers.RabbitMQ:
         return RabbitMessageQueue(pga_id)
+    elif MESSAGE_HANDLER == MessageHandlers.Local:
+        return LocalProcessPool(pga_id)
     else:
         raise Exception("No valid MessageHandler defined!")
 
 
+# Handlers are pooled per pga_id and shared by all requests and runs of that PGA.
+__DATABASE_HANDLERS = HandlerPool(create_database_handler)
+__MESSAGE_HANDLERS = HandlerPool(create_message_handler)
+
+
+def get_database_handler(pga_id):
+    return __DATABASE_HANDLERS.get(pga_id)
+
+
+def get_message_handler(pga_id):
+    return __MESSAGE_HANDLERS.get(pga_id)
+
+
+def close_handlers():
+    logging.info("Closing database and messaging connections.")
+    __DATABASE_HANDLERS.close_all()
+    __MESSAGE_HANDLERS.close_all()
+
+
+def shutdown():
+    # Abort running PGAs, then release all connections.
+    with __RUNS_LOCK:
+        running = [pga_run for pga_run in __RUNS.values() if pga_run.is_running()]
+    abort_runs(running)
+    __EXECUTOR.shutdown(wait=False)
+    close_handlers()
+
+
+atexit.register(close_handlers)
+
+
 if __name__ == "__main__":
-    rnr.run(host="0.0.0.0")
+    # Turn termination into a regular exit, so the runner shuts down cleanly.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        rnr.run(host="0.0.0.0")
+    finally:
+        shutdown()
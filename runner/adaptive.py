@@ -0,0 +1,137 @@
+import collections
+import math
+
+from utilities.properties import get_flag
+
+# Generations looked back on by the convergence check and the adaptive population size.
+DEFAULT_CONVERGENCE_WINDOW = 10
+# Factors the adaptive population size grows by while stagnating and shrinks by while improving.
+DEFAULT_GROWTH_FACTOR = 1.5
+DEFAULT_SHRINK_FACTOR = 0.75
+# Portions of improving generations in the window up to which the population grows, from which it shrinks.
+STAGNATION_RATE = 0.2
+PROGRESS_RATE = 0.5
+# Weight of the latest generation in the smoothed evaluator throughput.
+THROUGHPUT_SMOOTHING = 0.3
+
+
+class ConvergenceCheck(object):
+    # Tells a run has converged once its best fitness improved by less than epsilon over the last window generations,
+    # or once the diversity of its population collapsed: fewer distinct fitness values than the min_distinct_fitness
+    # portion, or a mean gene standard deviation below min_gene_stdev. Criteria left None are not checked.
+    def __init__(self, window=DEFAULT_CONVERGENCE_WINDOW, epsilon=None, min_distinct_fitness=None,
+                 min_gene_stdev=None):
+        self.best_fitness = collections.deque(maxlen=max(1, window) + 1)
+        self.epsilon = epsilon
+        self.min_distinct_fitness = min_distinct_fitness
+        self.min_gene_stdev = min_gene_stdev
+
+    @classmethod
+    def from_properties(cls, properties):
+        # Returns None unless any convergence criterion is configured.
+        check = cls(
+            window=properties.get("CONVERGENCE_WINDOW", DEFAULT_CONVERGENCE_WINDOW),
+            epsilon=properties.get("CONVERGENCE_EPSILON"),
+            min_distinct_fitness=properties.get("MIN_DISTINCT_FITNESS"),
+            min_gene_stdev=properties.get("MIN_GENE_STDEV"),
+        )
+        if check.epsilon is None and check.min_distinct_fitness is None and check.min_gene_stdev is None:
+            return None
+        return check
+
+    def check(self, summary):
+        # Takes the population summary of a finished generation, returns why the run converged or None.
+        self.best_fitness.append(summary["best"])
+        if (self.epsilon is not None
+                and self.best_fitness.__len__() == self.best_fitness.maxlen
+                and self.best_fitness[-1] - self.best_fitness[0] < self.epsilon):
+            return "best fitness improved by less than {eps_} within {window_} generations".format(
+                eps_=self.epsilon,
+                window_=self.best_fitness.maxlen - 1,
+            )
+        distinct_fitness = summary.get("distinct_fitness")
+        if (self.min_distinct_fitness is not None and distinct_fitness is not None
+                and distinct_fitness < self.min_distinct_fitness):
+            return "distinct fitness portion {div_:.3f} collapsed below {min_}".format(
+                div_=distinct_fitness,
+                min_=self.min_distinct_fitness,
+            )
+        gene_stdev = summary.get("gene_stdev")
+        if self.min_gene_stdev is not None and gene_stdev is not None and gene_stdev < self.min_gene_stdev:
+            return "gene standard deviation {div_:.3g} collapsed below {min_}".format(
+                div_=gene_stdev,
+                min_=self.min_gene_stdev,
+            )
+        return None
+
+
+class PopulationSizer(object):
+    # Adapts the size of the released population between min_size and max_size:
+    # once a window of generations is complete, it grows while the best fitness stagnates, to explore more,
+    # and shrinks while it keeps improving, to spend fewer evaluations per generation. The window starts anew
+    # after every change, so each size is judged on its own generations. With target_seconds set,
+    # the size never exceeds what the evaluators return within that time at their smoothed throughput.
+    def __init__(self, size, min_size, max_size, window=DEFAULT_CONVERGENCE_WINDOW, target_seconds=None,
+                 growth_factor=DEFAULT_GROWTH_FACTOR, shrink_factor=DEFAULT_SHRINK_FACTOR):
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.size = min(max(size, self.min_size), self.max_size)
+        self.improvements = collections.deque(maxlen=max(1, window))
+        self.target_seconds = target_seconds
+        self.growth_factor = growth_factor
+        self.shrink_factor = shrink_factor
+        self.throughput = None
+
+    @classmethod
+    def from_properties(cls, properties, population_size, current_size=None):
+        # Returns None unless ADAPTIVE_POPULATION is enabled. The bounds derive from the configured population_size,
+        # a resumed run continues with its current_size.
+        if not get_flag(properties, "ADAPTIVE_POPULATION"):
+            return None
+        return cls(
+            size=current_size or population_size,
+            min_size=properties.get("MIN_POPULATION_SIZE", max(2, population_size // 4)),
+            max_size=properties.get("MAX_POPULATION_SIZE", population_size * 4),
+            window=properties.get("ADAPTIVE_WINDOW", properties.get("CONVERGENCE_WINDOW", DEFAULT_CONVERGENCE_WINDOW)),
+            target_seconds=properties.get("ADAPTIVE_TARGET_SECONDS", properties.get("GENERATION_DEADLINE_SECONDS")),
+            growth_factor=properties.get("ADAPTIVE_GROWTH_FACTOR", DEFAULT_GROWTH_FACTOR),
+            shrink_factor=properties.get("ADAPTIVE_SHRINK_FACTOR", DEFAULT_SHRINK_FACTOR),
+        )
+
+    def adapt(self, improved, evaluated, seconds):
+        # Takes whether the last generation improved, how many individuals it got evaluated in how many seconds,
+        # returns the size of the next generation.
+        if evaluated > 0 and seconds > 0:
+            throughput = evaluated / seconds
+            if self.throughput is None:
+                self.throughput = throughput
+            else:
+                self.throughput += THROUGHPUT_SMOOTHING * (throughput - self.throughput)
+
+        self.improvements.append(bool(improved))
+        size = self.size
+        if self.improvements.__len__() == self.improvements.maxlen:
+            improvement_rate = sum(self.improvements) / self.improvements.__len__()
+            if improvement_rate <= STAGNATION_RATE:
+                size = math.ceil(size * self.growth_factor)
+            elif improvement_rate >= PROGRESS_RATE:
+                size = math.floor(size * self.shrink_factor)
+        if self.target_seconds and self.throughput is not None:
+            size = min(size, math.floor(self.throughput * self.target_seconds))
+        size = min(max(size, self.min_size), self.max_size)
+
+        if size != self.size:
+            self.size = size
+            self.improvements.clear()
+        return self.size
+
+
+def release_population(population, size, rng):
+    # The fittest size individuals of a sorted population, or all of them topped up with parents drawn again
+    # at random, so a grown population is filled by the offspring of the next generation.
+    if population.__len__() >= size:
+        return population[:size]
+    released = population
+    while 0 < population.__len__() and released.__len__() < size:
+        released = released + population.sample(size - released.__len__(), rng)
+    return released
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import random
+
+from database_handler.async_redis_handler import AsyncRedisHandler
+from message_handler.async_rabbit_message_queue import AsyncRabbitMessageQueue
+from message_handler.message_handler import GENERATION_HEADER
+from runner.generational import GenerationalRun, get_receive_settings, prepare_initial_population, \
+    resume_from_checkpoint
+from utilities import metrics, utils
+from utilities.history import GenerationHistory
+
+ASYNCIO = "asyncio"
+
+
+async def run_pga_async(pga_id, pga_run, resume, relevant_properties, fitness_cache):
+    # Runs the generations of a PGA on an event loop of its own, with coroutine based handlers created for the run.
+    # Persisting a generation overlaps with releasing and receiving the next one,
+    # shards are published concurrently and the HTTP endpoints keep being served by the Flask threads.
+    database_handler = AsyncRedisHandler(pga_id)
+    message_handler = AsyncRabbitMessageQueue(pga_id)
+    try:
+        return await evolve_pga_async(
+            pga_id, pga_run, resume, relevant_properties, fitness_cache, database_handler, message_handler)
+    finally:
+        await message_handler.close()
+        await database_handler.close()
+
+
+async def evolve_pga_async(pga_id, pga_run, resume, relevant_properties, fitness_cache,
+                           database_handler, message_handler):
+    # The generational loop of evolve_pga, awaiting the handlers. Blocking fitness cache calls run on threads.
+    properties = utils.get_pga_config(pga_id).get("properties")
+    receive_settings = get_receive_settings(properties, pga_run)
+
+    # Set relevant properties.
+    utils.set_properties(pga_id, await database_handler.retrieve_items(relevant_properties))
+    elitism_rate = utils.get_property(pga_id, "ELITISM_RATE")
+    population_size = utils.get_property(pga_id, "POPULATION_SIZE")
+    rng = random.Random()
+
+    # Continue from the last complete generation if requested, without re-evaluating its population.
+    checkpoint = None
+    if resume:
+        checkpoint, population = await database_handler.retrieve_checkpoint()
+        await asyncio.to_thread(resume_from_checkpoint, pga_id, checkpoint, population, rng, fitness_cache)
+
+    receipt = None
+    if checkpoint is None:
+        # The history of an earlier run does not continue.
+        await database_handler.clear_history()
+        logging.info("Collecting evaluated initial population.")
+        receipt = await message_handler.receive_messages(generation=0, **receive_settings)
+        population = await asyncio.to_thread(
+            prepare_initial_population, pga_id, population_size, pga_run, fitness_cache)
+        checkpoint = {}
+
+    generational_run = GenerationalRun(
+        pga_id=pga_id,
+        pga_run=pga_run,
+        properties=properties,
+        population=population,
+        population_size=population_size,
+        elitism_rate=elitism_rate,
+        fitness_cache=fitness_cache,
+        rng=rng,
+        checkpoint=checkpoint,
+        history=GenerationHistory.from_properties(pga_id, properties),
+    )
+    next_recipient = utils.get_messaging_pga(pga_id)
+
+    async def persist(population, checkpoint, received):
+        # The messages a generation was received in are acknowledged once it is persisted.
+        await database_handler.store_population(population, checkpoint=checkpoint)
+        await message_handler.acknowledge(received)
+
+    # At most one generation is being persisted while the next one runs.
+    persisting = None
+    try:
+        while True:
+            # Store population in the background, checkpointing the run state of the last complete generation,
+            # also once the run is complete.
+            if persisting is not None:
+                with metrics.span(pga_id, "store"):
+                    await persisting
+            persisting = asyncio.create_task(persist(
+                generational_run.population, generational_run.get_checkpoint(), receipt))
+            if not generational_run.is_running():
+                break
+
+            if pga_run.is_aborting():
+                logging.info("ATTENTION: Aborting PGA!")
+                break
+
+            generation = generational_run.generations_done + 1
+            logging.info("Starting new generation: {gen_}".format(gen_=generation))
+
+            # Release population to model and listen to FE queue.
+            released = generational_run.start_generation()
+            with metrics.span(pga_id, "release"):
+                await message_handler.send_message(
+                    individuals=released,
+                    next_recipient=next_recipient,
+                    headers={GENERATION_HEADER: generation},
+                )
+            with metrics.span(pga_id, "wait"):
+                receipt = await message_handler.receive_messages(generation=generation, **receive_settings)
+            with metrics.span(pga_id, "sort"):
+                new_individuals = utils.collect_and_reset_received_individuals(pga_id)
+
+            # An abort ends the wait early, the unfinished generation is neither selected nor recorded,
+            # its individuals are returned to the queue.
+            if pga_run.is_aborting():
+                logging.info("ATTENTION: Aborting PGA!")
+                await message_handler.requeue(receipt)
+                break
+            await asyncio.to_thread(generational_run.record_offspring, new_individuals)
+
+            # Select the next population and finish generation.
+            summary = generational_run.finish_generation(new_individuals)
+            if summary is not None:
+                await database_handler.store_summary(summary)
+    finally:
+        if persisting is not None:
+            await persisting
+
+    return generational_run.population
@@ -0,0 +1,250 @@
+import logging
+import math
+import time
+import warnings
+
+from message_handler.message_handler import LATE_ARRIVALS_RECYCLE
+from population import selection
+from runner.adaptive import ConvergenceCheck, PopulationSizer, release_population
+from utilities import metrics, utils
+from utilities.history import summarize_population
+
+GENERATIONAL = "generational"
+
+
+def get_receive_settings(properties, pga_run):
+    # Proceed once the quorum has arrived or the deadline has passed, or right away once the run is aborting.
+    return {
+        "quorum": float(properties.get("GENERATION_QUORUM", 1.0)),
+        "deadline_seconds": properties.get("GENERATION_DEADLINE_SECONDS"),
+        "late_arrivals": properties.get("LATE_ARRIVALS", LATE_ARRIVALS_RECYCLE),
+        "should_stop": pga_run.is_aborting,
+    }
+
+
+def resume_from_checkpoint(pga_id, checkpoint, population, rng, fitness_cache):
+    # Restores the run state of a retrieved checkpoint and remembers the fitness of its population.
+    # Without checkpoint, the run starts anew.
+    if checkpoint is None:
+        warnings.warn("No checkpoint found to resume PGA {id_} from, starting anew.".format(id_=pga_id))
+        return
+    logging.info("Resuming from checkpoint: {gen_} generations done, {amount_} individuals.".format(
+        gen_=checkpoint.get("generations_done", 0),
+        amount_=population.__len__(),
+    ))
+    utils.set_random_state(rng, checkpoint.get("random_state"))
+    fitness_cache.record(population)
+
+
+def prepare_initial_population(pga_id, population_size, pga_run, fitness_cache):
+    # Takes the received initial population, remembers its fitness and crops it to the population size.
+    population = utils.collect_and_reset_received_individuals(pga_id)
+    fitness_cache.record(population)
+    return crop_initial_population(population, population_size, pga_run)
+
+
+def crop_initial_population(population, population_size, pga_run):
+    # Crop the evaluated initial population if too large. Fail if none of it arrived, unless aborted meanwhile.
+    if population.__len__() == 0 and not pga_run.is_aborting():
+        raise Exception("No evaluated individuals of the initial population arrived!")
+    if population.__len__() > population_size:
+        warnings.warn("Population too large! Expected {exp_} - Actual {act_}".format(
+            exp_=population_size,
+            act_=population.__len__()
+        ))
+        logging.info("Cropping population to defined size.")
+        return population[:population_size]
+    if population.__len__() < population_size:
+        warnings.warn("Population not large enough! Expected {exp_} - Actual {act_}".format(
+            exp_=population_size,
+            act_=population.__len__()
+        ))
+    return population
+
+
+class GenerationalRun(object):
+    # The steps of the generational loop around releasing a population and receiving its offspring.
+    # They are shared by the threaded and the asyncio runtime, whose loops only wait for the handlers.
+    # Counters continue from the checkpoint of a resumed run.
+    def __init__(self, pga_id, pga_run, properties, population, population_size, elitism_rate, fitness_cache, rng,
+                 checkpoint, history=None):
+        self.pga_id = pga_id
+        self.pga_run = pga_run
+        self.population = population
+        self.elitism_rate = elitism_rate
+        self.fitness_cache = fitness_cache
+        self.rng = rng
+        self.history = history
+
+        # Collect termination criteria.
+        self.max_generations = properties.get("MAX_GENERATIONS")
+        self.max_unimproved_generations = properties.get("MAX_UNIMPROVED_GENERATIONS")
+        self.max_time_seconds = properties.get("MAX_TIME_SECONDS")
+
+        # Prepare generation handling.
+        self.selection_strategy = properties.get("SELECTION_STRATEGY", selection.TRUNCATION)
+        self.tournament_size = properties.get("TOURNAMENT_SIZE", selection.DEFAULT_TOURNAMENT_SIZE)
+        self.generations_done = checkpoint.get("generations_done", 0)
+        self.unimproved_generations = checkpoint.get("unimproved_generations", 0)
+        self.pga_runtime = checkpoint.get("runtime_seconds", 0)
+        self.pga_start_time = time.perf_counter() - self.pga_runtime
+
+        # Adapt the released population size and stop once converged, if configured.
+        self.population_size = population_size
+        self.population_sizer = PopulationSizer.from_properties(
+            properties, population_size, checkpoint.get("population_size"))
+        if self.population_sizer is not None:
+            self.population_size = self.population_sizer.size
+            utils.set_property(pga_id, "POPULATION_SIZE", self.population_size)
+        self.convergence_check = ConvergenceCheck.from_properties(properties)
+        self.converged = None
+
+        # State of the current generation.
+        self.elite = None
+        self.old_fittest = None
+        self.evaluation_start = None
+        self.evaluation_seconds = 0
+        self.evaluated = 0
+
+    def is_running(self):
+        return (self.converged is None
+                and self.generations_done < self.max_generations
+                and self.unimproved_generations < self.max_unimproved_generations
+                and self.pga_runtime < self.max_time_seconds)
+
+    def get_checkpoint(self):
+        # The run state of the last complete generation, stored along with its population.
+        return {
+            "mode": GENERATIONAL,
+            "generations_done": self.generations_done,
+            "unimproved_generations": self.unimproved_generations,
+            "runtime_seconds": self.pga_runtime,
+            "random_state": self.rng.getstate(),
+            "population_size": self.population_size,
+        }
+
+    def start_generation(self):
+        # Returns the population to release to the model, after setting the elite aside.
+        self.old_fittest = self.population[0]
+
+        # Apply elitism. Ensure at least the very best individual is transferred to the next generation.
+        logging.info("Applying elitism to current population.")
+        elite_portion = math.floor(self.population.__len__() * self.elitism_rate)
+        if not elite_portion > 0:
+            elite_portion = 1
+        self.elite = self.population.elite(elite_portion)
+
+        # Release entire population to model, resized to the adapted population size.
+        logging.info("Releasing population to model.")
+        self.evaluation_start = time.perf_counter()
+        if self.population_sizer is None:
+            return self.population
+        return release_population(self.population, self.population_size, self.rng)
+
+    def record_offspring(self, new_individuals):
+        # Remember the evaluated solutions and report how many of them had been evaluated before.
+        self.evaluation_seconds = time.perf_counter() - self.evaluation_start
+        self.evaluated = new_individuals.__len__()
+        duplicates = self.fitness_cache.count_known(new_individuals)
+        metrics.inc("pga_duplicate_evaluations_total", self.pga_id, duplicates)
+        logging.info("Received {dup_} duplicate evaluations, fitness cache hit rate {rate_:.2%}.".format(
+            dup_=duplicates,
+            rate_=self.fitness_cache.hit_rate(),
+        ))
+
+    def finish_generation(self, new_individuals):
+        # Selects the next population among the elite, parents and offspring and finishes the generation.
+        # Returns the summary of the generation to store, None unless the history is recorded.
+        population_size = self.population_size
+
+        # Keep the parents if no offspring arrived before the deadline, else crop new population if too large.
+        if new_individuals.__len__() == 0:
+            warnings.warn("No offspring arrived in generation #{gen_}, keeping the parents.".format(
+                gen_=self.generations_done + 1,
+            ))
+            metrics.inc("pga_underfilled_generations_total", self.pga_id)
+        elif new_individuals.__len__() > population_size:
+            warnings.warn("Cropping oversized population! Expected {exp_} - Actual {act_}".format(
+                exp_=population_size,
+                act_=new_individuals.__len__()
+            ))
+            metrics.inc("pga_cropped_individuals_total", self.pga_id, new_individuals.__len__() - population_size)
+            new_individuals = new_individuals[:population_size]
+        elif new_individuals.__len__() < population_size:
+            warnings.warn("Population not large enough! Expected {exp_} - Actual {act_}".format(
+                exp_=population_size,
+                act_=new_individuals.__len__()
+            ))
+            metrics.inc("pga_underfilled_generations_total", self.pga_id)
+
+        # Apply survival selection among the sorted elite, parents and returning individuals,
+        # keeping the population at its defined size even after under-filled generations.
+        if new_individuals.__len__() > 0:
+            logging.info("Applying {strategy_} survival selection to population.".format(
+                strategy_=self.selection_strategy,
+            ))
+            with metrics.span(self.pga_id, "select"):
+                self.population = selection.select_survivors(
+                    strategy=self.selection_strategy,
+                    parents=self.population,
+                    elite=self.elite,
+                    offspring=new_individuals,
+                    size=population_size,
+                    rng=self.rng,
+                    tournament_size=self.tournament_size,
+                )
+
+        # Finish generation.
+        self.generations_done += 1
+        metrics.inc("pga_generations_total", self.pga_id)
+        metrics.set_fitness_stats(self.pga_id, self.population.stats())
+        improved = self.population[0].fitness > self.old_fittest.fitness
+        if not improved:
+            self.unimproved_generations += 1
+            logging.info("Finished generation #{gen_} - unimproved #{unimp_}.".format(
+                gen_=self.generations_done,
+                unimp_=self.unimproved_generations,
+            ))
+        else:
+            self.unimproved_generations = 0
+            logging.info("Finished generation #{gen_} - improved individuals.".format(gen_=self.generations_done))
+        self.pga_runtime = time.perf_counter() - self.pga_start_time
+        self.pga_run.update_progress(
+            generations_done=self.generations_done,
+            unimproved_generations=self.unimproved_generations,
+            runtime_seconds=self.pga_runtime,
+            best_fitness=self.population[0].fitness,
+            fitness_cache=self.fitness_cache.stats(),
+        )
+        summary = None
+        if self.history is not None:
+            summary = self.history.summarize(
+                generation=self.generations_done,
+                population=self.population,
+                improved=improved,
+                runtime_seconds=self.pga_runtime,
+            )
+
+        # Stop early once the run has converged, further generations would hardly improve it.
+        if self.convergence_check is not None:
+            self.converged = self.convergence_check.check(summary or summarize_population(self.population))
+            if self.converged is not None:
+                logging.info("Converged after generation #{gen_}: {reason_}.".format(
+                    gen_=self.generations_done,
+                    reason_=self.converged,
+                ))
+                self.pga_run.update_progress(converged=self.converged)
+                return summary
+
+        # Adapt the population size of the next generation to the improvement rate and evaluator throughput.
+        if self.population_sizer is not None:
+            next_population_size = self.population_sizer.adapt(improved, self.evaluated, self.evaluation_seconds)
+            if next_population_size != self.population_size:
+                logging.info("Adapting population size from {old_} to {new_}.".format(
+                    old_=self.population_size,
+                    new_=next_population_size,
+                ))
+                self.population_size = next_population_size
+                utils.set_property(self.pga_id, "POPULATION_SIZE", self.population_size)
+            self.pga_run.update_progress(population_size=self.population_size)
+        return summary
@@ -0,0 +1,288 @@
+import logging
+import math
+import time
+
+from message_handler.message_handler import GENERATION_HEADER, ISLAND_HEADER, LATE_ARRIVALS_DROP
+from population.population import Population, PopulationBuffer
+from utilities import metrics, utils
+
+ISLANDS = "islands"
+
+# Migration topologies: to the next island, to all other islands, or to one island drawn at random.
+TOPOLOGY_RING = "ring"
+TOPOLOGY_COMPLETE = "complete"
+TOPOLOGY_RANDOM = "random"
+
+# Set if the model and evaluation stages pass message headers on, island runs over a broker depend on that.
+STAGES_PASS_HEADERS = "STAGES_PASS_HEADERS"
+
+
+class Island(object):
+    # One sub-population with its own elitism and generation count, evolving independently of the others.
+    def __init__(self, island_id, population, size, generations_done=0, unimproved_generations=0):
+        self.island_id = island_id
+        self.population = population
+        self.size = size
+        self.generations_done = generations_done
+        self.unimproved_generations = unimproved_generations
+        self.elite = Population()
+        self.pending = PopulationBuffer()
+        self.immigrants = PopulationBuffer()
+        self.in_flight = 0
+        self.released_at = None
+        self.finished = False
+
+    def to_checkpoint(self):
+        return {
+            "size": self.population.__len__(),
+            "generations_done": self.generations_done,
+            "unimproved_generations": self.unimproved_generations,
+        }
+
+
+def migration_targets(island_id, island_count, topology, rng):
+    if island_count <= 1:
+        return []
+    if topology == TOPOLOGY_RING:
+        return [(island_id + 1) % island_count]
+    if topology == TOPOLOGY_COMPLETE:
+        return [target for target in range(island_count) if target != island_id]
+    if topology == TOPOLOGY_RANDOM:
+        return [rng.choice([target for target in range(island_count) if target != island_id])]
+    raise Exception("No valid migration topology '{top_}' defined!".format(top_=topology))
+
+
+def split_islands(population, population_size, island_count, checkpoint):
+    # A resumed run restores its islands from the checkpoint, a new run deals the population round robin,
+    # so every island starts with individuals across the whole fitness range.
+    island_checkpoints = checkpoint.get("islands")
+    if island_checkpoints:
+        islands = []
+        start = 0
+        for island_id, island_checkpoint in enumerate(island_checkpoints):
+            end = start + island_checkpoint["size"]
+            islands.append(Island(
+                island_id=island_id,
+                population=population[start:end].sorted(),
+                size=island_checkpoint["size"],
+                generations_done=island_checkpoint["generations_done"],
+                unimproved_generations=island_checkpoint["unimproved_generations"],
+            ))
+            start = end
+        return islands
+
+    # Keep at least two individuals per island, an island without any would never release or improve.
+    available = min(population_size, population.__len__())
+    if island_count > max(1, available // 2):
+        logging.info("Reducing island count from {count_} to {new_} for {size_} individuals.".format(
+            count_=island_count,
+            new_=max(1, available // 2),
+            size_=available,
+        ))
+        island_count = max(1, available // 2)
+    parts = population.split(island_count)
+    return [
+        Island(
+            island_id=island_id,
+            population=parts[island_id],
+            size=population_size // island_count + (1 if island_id < population_size % island_count else 0),
+        )
+        for island_id in range(island_count)
+    ]
+
+
+def run_islands(pga_id, pga_run, population, population_size, island_count, elitism_rate, migration, termination,
+                receive_settings, database_handler, message_handler, rng, checkpoint, history=None):
+    # Evolves island_count sub-populations, each released and selected on its own as soon as its individuals
+    # have returned, tagged with the island header. Every migration interval of its own generations,
+    # an island sends copies of its best individuals to the islands given by the migration topology,
+    # which take them into account at their next survival selection. There is no barrier across islands.
+    # All islands share the queues of the PGA, so the model and evaluation stages have to pass the island header on,
+    # individuals returned without it cannot be told apart and stop the run with an error. The stages are not part
+    # of the runner, so island runs over a broker are only started if STAGES_PASS_HEADERS confirms they do.
+    islands = split_islands(population, population_size, island_count, checkpoint)
+    next_recipient = utils.get_messaging_pga(pga_id)
+    required_portion = receive_settings["quorum"]
+    deadline_seconds = receive_settings["deadline_seconds"]
+    pga_start_time = time.perf_counter() - checkpoint.get("runtime_seconds", 0)
+    state = {
+        "stored_round": min(island.generations_done for island in islands),
+        "error": None,
+        "best_fitness": max((island.population[0].fitness for island in islands
+                             if island.population.__len__() > 0), default=None),
+    }
+
+    def combined_population():
+        combined = Population()
+        for island in islands:
+            combined = combined + island.population
+        return combined
+
+    def store():
+        # Persists all islands in island order, the checkpoint keeps where each island starts.
+        with metrics.span(pga_id, "store"):
+            database_handler.store_population(combined_population(), checkpoint={
+                "mode": ISLANDS,
+                "islands": [island.to_checkpoint() for island in islands],
+                "runtime_seconds": time.perf_counter() - pga_start_time,
+                "random_state": rng.getstate(),
+            })
+
+    def release(island):
+        # Apply elitism. Ensure at least the very best individual of the island is kept.
+        elite_portion = max(1, math.floor(island.population.__len__() * elitism_rate))
+        island.elite = island.population.elite(elite_portion)
+        with metrics.span(pga_id, "release"):
+            message_handler.send_message(
+                individuals=island.population,
+                next_recipient=next_recipient,
+                headers={GENERATION_HEADER: island.generations_done + 1, ISLAND_HEADER: island.island_id},
+            )
+        island.in_flight = island.population.__len__()
+        island.released_at = time.perf_counter()
+
+    def migrate(island):
+        migrants = island.population.elite(max(1, math.floor(island.population.__len__() * migration["rate"])))
+        for target in migration_targets(island.island_id, islands.__len__(), migration["topology"], rng):
+            if not islands[target].finished:
+                islands[target].immigrants.extend(migrants)
+
+    def finish_generation(island):
+        new_individuals = island.pending.to_population()
+        island.pending = PopulationBuffer()
+        if new_individuals.__len__() > island.size:
+            metrics.inc("pga_cropped_individuals_total", pga_id, new_individuals.__len__() - island.size)
+            new_individuals = new_individuals.top_k(island.size)
+        elif new_individuals.__len__() < island.size:
+            metrics.inc("pga_underfilled_generations_total", pga_id)
+
+        # Survival selection among elite, immigrants and returning individuals.
+        # Without any returning individuals, the whole island population competes with the immigrants.
+        old_best = island.population[0].fitness if island.population.__len__() > 0 else None
+        with metrics.span(pga_id, "select"):
+            survivors = island.elite if new_individuals.__len__() > 0 else island.population
+            candidates = survivors + island.immigrants.to_population() + new_individuals
+            island.population = candidates.top_k(island.size)
+        island.immigrants = PopulationBuffer()
+        island.in_flight = 0
+
+        island.generations_done += 1
+        metrics.inc("pga_generations_total", pga_id)
+        if old_best is not None and old_best >= island.population[0].fitness:
+            island.unimproved_generations += 1
+        else:
+            island.unimproved_generations = 0
+        logging.info("Island {island_}: finished generation #{gen_} - unimproved #{unimp_}.".format(
+            island_=island.island_id,
+            gen_=island.generations_done,
+            unimp_=island.unimproved_generations,
+        ))
+
+        if migration["interval"] > 0 and island.generations_done % migration["interval"] == 0:
+            migrate(island)
+        if (island.generations_done >= termination["max_generations"]
+                or island.unimproved_generations >= termination["max_unimproved_generations"]):
+            island.finished = True
+
+        # Persist once all islands are past another generation.
+        completed_round = min(other.generations_done for other in islands)
+        if completed_round > state["stored_round"]:
+            state["stored_round"] = completed_round
+            store()
+            combined = combined_population()
+            metrics.set_fitness_stats(pga_id, combined.stats())
+            if history is not None:
+                best_fitness = float(combined.fitness.max())
+                improved = state["best_fitness"] is None or best_fitness > state["best_fitness"]
+                state["best_fitness"] = best_fitness
+                database_handler.store_summary(history.summarize(
+                    generation=completed_round,
+                    population=combined,
+                    improved=improved,
+                    runtime_seconds=time.perf_counter() - pga_start_time,
+                ))
+        report_progress()
+
+        if not island.finished and not terminated():
+            release(island)
+
+    def report_progress():
+        best_fitness = max(island.population[0].fitness for island in islands if island.population.__len__() > 0)
+        pga_run.update_progress(
+            generations_done=min(island.generations_done for island in islands),
+            unimproved_generations=min(island.unimproved_generations for island in islands),
+            runtime_seconds=time.perf_counter() - pga_start_time,
+            best_fitness=best_fitness,
+            islands=[island.to_checkpoint() for island in islands],
+        )
+
+    def generation_closed(island):
+        required_amount = max(1, math.ceil(island.size * required_portion))
+        if island.pending.__len__() >= required_amount or island.in_flight <= 0:
+            return True
+        # Past the deadline, proceed with whatever has arrived so far, even if nothing has.
+        return deadline_seconds is not None and time.perf_counter() - island.released_at >= deadline_seconds
+
+    def terminated():
+        return (all(island.finished for island in islands)
+                or time.perf_counter() - pga_start_time >= termination["max_time_seconds"]
+                or pga_run.is_aborting()
+                or state["error"] is not None)
+
+    def on_individuals(individuals, headers):
+        island_id = headers.get(ISLAND_HEADER)
+        if not isinstance(island_id, int) or not 0 <= island_id < islands.__len__():
+            state["error"] = ("Island mode requires the model and evaluation stages to pass the {header_} header on, "
+                              "received individuals with {header_}={id_}!").format(
+                header_=ISLAND_HEADER,
+                id_=island_id,
+            )
+            return True
+        island = islands[island_id]
+        if island.finished:
+            return False
+
+        # Individuals released in an earlier generation of the island arrive late, recycle them or drop them.
+        released_in = headers.get(GENERATION_HEADER)
+        if released_in is not None and released_in <= island.generations_done:
+            metrics.inc("pga_late_individuals_total", pga_id, individuals.__len__())
+            if receive_settings["late_arrivals"] == LATE_ARRIVALS_DROP:
+                return False
+        else:
+            island.in_flight = max(0, island.in_flight - individuals.__len__())
+        island.pending.extend(individuals)
+
+        if generation_closed(island):
+            finish_generation(island)
+        return terminated()
+
+    def should_stop():
+        # Close generations whose deadline has passed while no individuals are arriving.
+        if deadline_seconds is not None:
+            for island in islands:
+                if not island.finished and island.in_flight > 0 and generation_closed(island):
+                    finish_generation(island)
+        return terminated()
+
+    logging.info("Starting island evolution with {count_} islands, migrating every {interval_} generations.".format(
+        count_=islands.__len__(),
+        interval_=migration["interval"],
+    ))
+    store()
+    for island in islands:
+        if (island.generations_done >= termination["max_generations"]
+                or island.unimproved_generations >= termination["max_unimproved_generations"]):
+            island.finished = True
+        else:
+            release(island)
+    message_handler.receive_continuously(on_individuals=on_individuals, should_stop=should_stop)
+    if state["error"] is not None:
+        raise Exception(state["error"])
+
+    store()
+    if pga_run.is_aborting():
+        logging.info("ATTENTION: Aborting PGA!")
+    logging.info("Finished island evolution after {gen_} generations per island.".format(
+        gen_=[island.generations_done for island in islands],
+    ))
+    return combined_population().sorted()
@@ -0,0 +1,83 @@
+import threading
+import time
+
+QUEUED = "queued"
+RUNNING = "running"
+FINISHED = "finished"
+ABORTED = "aborted"
+FAILED = "failed"
+
+
+class PgaRun(object):
+    # Handle of one PGA executed in the background, shared between the generation loop and the HTTP endpoints.
+    # It is queued until a worker of the executor starts it.
+    def __init__(self, pga_id):
+        self.pga_id = pga_id
+        self.state = QUEUED
+        self.abort_event = threading.Event()
+        self.finished_event = threading.Event()
+        self.started_at = None
+        self.finished_at = None
+        self.fittest = None
+        self.error = None
+        self.progress = {
+            "generations_done": 0,
+            "unimproved_generations": 0,
+            "runtime_seconds": 0,
+            "best_fitness": None,
+        }
+        self.__lock = threading.Lock()
+
+    def is_running(self):
+        return not self.finished_event.is_set()
+
+    def start(self):
+        # Returns False if the run was aborted while queued, it must not run then.
+        with self.__lock:
+            if self.state != QUEUED:
+                return False
+            self.state = RUNNING
+            self.started_at = time.time()
+            return True
+
+    def request_abort(self):
+        # A queued run terminates right away, a running one once its loop notices.
+        with self.__lock:
+            self.abort_event.set()
+            if self.state == QUEUED:
+                self.__terminate(ABORTED)
+
+    def is_aborting(self):
+        return self.abort_event.is_set()
+
+    def update_progress(self, **progress):
+        with self.__lock:
+            self.progress.update(progress)
+
+    def get_progress(self):
+        with self.__lock:
+            return dict(self.progress)
+
+    def finish(self, fittest):
+        self.fittest = fittest
+        self.__terminate(ABORTED if self.is_aborting() else FINISHED)
+
+    def fail(self, error):
+        self.error = str(error)
+        self.__terminate(FAILED)
+
+    def wait(self, timeout=None):
+        return self.finished_event.wait(timeout)
+
+    def to_status(self):
+        return {
+            "id": self.pga_id,
+            "status": self.state,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    def __terminate(self, state):
+        self.state = state
+        self.finished_at = time.time()
+        self.finished_event.set()
@@ -0,0 +1,115 @@
+import logging
+import time
+
+from population.population import PopulationBuffer
+from utilities import metrics, utils
+
+STEADY_STATE = "steady_state"
+
+
+def run_steady_state(pga_id, pga_run, population, population_size, release_size, termination,
+                     database_handler, message_handler, rng, checkpoint, history=None):
+    # Evolves the population without a generational barrier:
+    # arriving individuals are merged into the bounded top-k population in batches of release_size,
+    # and every merge releases new parents to the model, so up to population_size evaluations stay in flight.
+    # Termination counts evaluations, the generation based criteria are converted by the population size.
+    max_evaluations = termination["max_evaluations"]
+    max_unimproved_evaluations = termination["max_unimproved_evaluations"]
+    max_time_seconds = termination["max_time_seconds"]
+    release_size = max(1, min(release_size, population_size))
+    next_recipient = utils.get_messaging_pga(pga_id)
+
+    # Counters continue from the checkpoint of a resumed run.
+    state = {
+        "population": population,
+        "pending": PopulationBuffer(),
+        "evaluations": checkpoint.get("evaluations", 0),
+        "last_improvement": checkpoint.get("last_improvement", 0),
+        "in_flight": 0,
+        "persisted_at": checkpoint.get("evaluations", 0),
+    }
+    pga_start_time = time.perf_counter() - checkpoint.get("runtime_seconds", 0)
+
+    def store():
+        with metrics.span(pga_id, "store"):
+            database_handler.store_population(state["population"], checkpoint={
+                "mode": STEADY_STATE,
+                "evaluations": state["evaluations"],
+                "last_improvement": state["last_improvement"],
+                "runtime_seconds": time.perf_counter() - pga_start_time,
+                "random_state": rng.getstate(),
+            })
+
+    def release():
+        with metrics.span(pga_id, "release"):
+            while state["population"].__len__() > 0 and state["in_flight"] + release_size <= population_size:
+                parents = state["population"].sample(release_size, rng)
+                message_handler.send_message(individuals=parents, next_recipient=next_recipient)
+                state["in_flight"] += parents.__len__()
+
+    def merge_pending():
+        if state["pending"].__len__() == 0:
+            return
+        old_best = state["population"][0].fitness if state["population"].__len__() > 0 else None
+        with metrics.span(pga_id, "select"):
+            merged = (state["population"] + state["pending"].to_population()).top_k(population_size)
+        state["pending"] = PopulationBuffer()
+        state["population"] = merged
+        if old_best is None or merged[0].fitness > old_best:
+            state["last_improvement"] = state["evaluations"]
+
+        # Persist and report once per population_size evaluations, the steady-state equivalent of a generation.
+        if state["evaluations"] - state["persisted_at"] >= population_size:
+            improved = state["last_improvement"] > state["persisted_at"]
+            state["persisted_at"] = state["evaluations"]
+            store()
+            metrics.inc("pga_generations_total", pga_id)
+            metrics.set_fitness_stats(pga_id, merged.stats())
+            if history is not None:
+                database_handler.store_summary(history.summarize(
+                    generation=state["evaluations"] // population_size,
+                    population=merged,
+                    improved=improved,
+                    runtime_seconds=time.perf_counter() - pga_start_time,
+                    evaluations=state["evaluations"],
+                ))
+            logging.info("Steady state: {evals_} evaluations, best fitness {best_}.".format(
+                evals_=state["evaluations"],
+                best_=merged[0].fitness,
+            ))
+        pga_run.update_progress(
+            evaluations=state["evaluations"],
+            generations_done=state["evaluations"] // population_size,
+            unimproved_generations=(state["evaluations"] - state["last_improvement"]) // population_size,
+            runtime_seconds=time.perf_counter() - pga_start_time,
+            best_fitness=merged[0].fitness,
+        )
+
+    def terminated():
+        return (state["evaluations"] >= max_evaluations
+                or state["evaluations"] - state["last_improvement"] >= max_unimproved_evaluations
+                or time.perf_counter() - pga_start_time >= max_time_seconds
+                or pga_run.is_aborting())
+
+    def on_individuals(individuals, headers):
+        state["pending"].extend(individuals)
+        state["evaluations"] += individuals.__len__()
+        state["in_flight"] = max(0, state["in_flight"] - individuals.__len__())
+        if state["pending"].__len__() >= release_size or state["in_flight"] == 0:
+            merge_pending()
+            if terminated():
+                return True
+            release()
+        return False
+
+    logging.info("Starting steady-state evolution, releasing {size_} parents at a time.".format(size_=release_size))
+    store()
+    release()
+    message_handler.receive_continuously(on_individuals=on_individuals, should_stop=terminated)
+    merge_pending()
+    store()
+
+    if pga_run.is_aborting():
+        logging.info("ATTENTION: Aborting PGA!")
+    logging.info("Finished steady-state evolution after {evals_} evaluations.".format(evals_=state["evaluations"]))
+    return state["population"]
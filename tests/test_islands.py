@@ -0,0 +1,50 @@
+import unittest
+from unittest import mock
+
+import runner.__main__ as runner_main
+from benchmarks.generation_loop import SyntheticEvaluator, run_once
+from runner.islands import split_islands
+from utilities import utils
+
+
+class SplitIslandsTest(unittest.TestCase):
+    def test_every_island_gets_individuals(self):
+        population = SyntheticEvaluator(1).random_population(5, 3).sorted()
+        islands = split_islands(population, 5, 4, {})
+        self.assertEqual(islands.__len__(), 2)
+        self.assertTrue(all(island.population.__len__() >= 2 for island in islands))
+        self.assertEqual(sum(island.population.__len__() for island in islands), 5)
+
+    def test_single_island_for_tiny_population(self):
+        population = SyntheticEvaluator(1).random_population(3, 3).sorted()
+        islands = split_islands(population, 3, 4, {})
+        self.assertEqual(islands.__len__(), 1)
+        self.assertEqual(islands[0].population.__len__(), 3)
+
+
+class TinyIslandRunTest(unittest.TestCase):
+    def setUp(self):
+        self.handler_getters = (runner_main.get_database_handler, runner_main.get_message_handler)
+
+    def tearDown(self):
+        runner_main.get_database_handler, runner_main.get_message_handler = self.handler_getters
+
+    def test_all_islands_finish_their_generations(self):
+        properties = {
+            "POPULATION_SIZE": 3,
+            "ELITISM_RATE": 0.1,
+            "MAX_GENERATIONS": 5,
+            "MAX_UNIMPROVED_GENERATIONS": 6,
+            "MAX_TIME_SECONDS": float("inf"),
+            "GENERATION_MODE": "islands",
+            "ISLAND_COUNT": 4,
+            "WRITE_BEHIND": False,
+        }
+        with mock.patch.object(utils, "get_pga_config", lambda _: {"properties": properties}):
+            _, progress = run_once(9001, properties, solution_size=3, seed=1)
+        self.assertEqual(progress["generations_done"], 5)
+        self.assertEqual([island["generations_done"] for island in progress["islands"]], [5])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import logging
+import threading
+
+
+class HandlerPool(object):
+    # Process-wide handlers keyed by pga_id, created on first use and reused by all threads until closed.
+    # Handlers are created under a lock of their pga_id only, so connecting for one PGA does not block the others.
+    def __init__(self, create_handler):
+        self.create_handler = create_handler
+        self.handlers = {}
+        self.creation_locks = {}
+        self.lock = threading.Lock()
+
+    def get(self, pga_id):
+        with self.lock:
+            handler = self.handlers.get(pga_id)
+            if handler is not None:
+                return handler
+            creation_lock = self.creation_locks.setdefault(pga_id, threading.Lock())
+
+        with creation_lock:
+            with self.lock:
+                handler = self.handlers.get(pga_id)
+            if handler is None:
+                handler = self.create_handler(pga_id)
+                with self.lock:
+                    self.handlers[pga_id] = handler
+            return handler
+
+    def peek(self, pga_id):
+        # The handler of pga_id if created already, None otherwise.
+        with self.lock:
+            return self.handlers.get(pga_id)
+
+    def close(self, pga_id):
+        with self.lock:
+            handler = self.handlers.pop(pga_id, None)
+        if handler is not None:
+            handler.close()
+
+    def close_all(self):
+        with self.lock:
+            handlers = list(self.handlers.items())
+            self.handlers = {}
+        for pga_id, handler in handlers:
+            try:
+                handler.close()
+            except Exception:
+                logging.exception("Error closing handler of PGA {id_}.".format(id_=pga_id))
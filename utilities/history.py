@@ -0,0 +1,86 @@
+import time
+
+import numpy
+
+from utilities import metrics
+from utilities.properties import get_flag
+
+# Fitness quantiles recorded per generation, unless set by the HISTORY_QUANTILES property.
+DEFAULT_HISTORY_QUANTILES = [0.25, 0.5, 0.75]
+# Summaries returned per page of the history endpoint by default, and at most.
+DEFAULT_HISTORY_PAGE_SIZE = 100
+MAX_HISTORY_PAGE_SIZE = 1000
+
+
+def summarize_population(population, quantiles=None):
+    # Fitness statistics and diversity of a population, computed on its fitness array at once.
+    # distinct_fitness is the portion of distinct fitness values, gene_stdev the mean standard deviation
+    # of the genes of numeric solutions of equal length, None for any other solutions.
+    quantiles = DEFAULT_HISTORY_QUANTILES if quantiles is None else quantiles
+    if population.__len__() == 0:
+        return {"size": 0, "best": None, "worst": None, "mean": None, "stdev": None,
+                "quantiles": {}, "distinct_fitness": None, "gene_stdev": None}
+
+    fitness = population.fitness
+    levels = numpy.quantile(fitness, [0.0, 1.0] + list(quantiles)).tolist()
+    return {
+        "size": population.__len__(),
+        "best": levels[1],
+        "worst": levels[0],
+        "mean": float(fitness.mean()),
+        "stdev": float(fitness.std()),
+        "quantiles": {str(quantile): level for quantile, level in zip(quantiles, levels[2:])},
+        "distinct_fitness": numpy.unique(fitness).__len__() / fitness.__len__(),
+        "gene_stdev": gene_stdev(population.solutions),
+    }
+
+
+def gene_stdev(solutions):
+    if not isinstance(solutions[0], (list, tuple)):
+        return None
+    try:
+        genes = numpy.asarray(solutions, dtype=numpy.float64)
+    except (TypeError, ValueError):
+        return None
+    if genes.ndim != 2 or genes.shape[1] == 0:
+        return None
+    return float(genes.std(axis=0).mean())
+
+
+class GenerationHistory(object):
+    # Builds the summary of each finished generation: its population summary, whether the best fitness improved,
+    # the seconds since the last summary and the seconds spent per phase of the generation loop in between.
+    # The summaries are stored by the database handler of the PGA, in order, as its convergence history.
+    def __init__(self, pga_id, quantiles=None):
+        self.pga_id = pga_id
+        self.quantiles = quantiles
+        self.phase_seconds = self.__get_phase_totals()
+        self.last_time = time.perf_counter()
+
+    @classmethod
+    def from_properties(cls, pga_id, properties):
+        # Returns None if RECORD_HISTORY is disabled.
+        if not get_flag(properties, "RECORD_HISTORY", True):
+            return None
+        return cls(pga_id, properties.get("HISTORY_QUANTILES"))
+
+    def summarize(self, generation, population, improved, runtime_seconds, **details):
+        now = time.perf_counter()
+        phase_seconds = self.__get_phase_totals()
+        summary = {
+            "generation": generation,
+            "timestamp": time.time(),
+            "improved": bool(improved),
+            "runtime_seconds": runtime_seconds,
+            "generation_seconds": now - self.last_time,
+            "phase_seconds": {phase: seconds - self.phase_seconds.get(phase, 0.0)
+                              for phase, seconds in phase_seconds.items()},
+        }
+        summary.update(summarize_population(population, self.quantiles))
+        summary.update(details)
+        self.phase_seconds = phase_seconds
+        self.last_time = now
+        return summary
+
+    def __get_phase_totals(self):
+        return {phase: total for phase, (_, total) in metrics.get_phase_seconds(self.pga_id).items()}
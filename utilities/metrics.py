@@ -0,0 +1,100 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Per-PGA counters, gauges and phase timings, exposed in the Prometheus text format.
+COUNTER = "counter"
+GAUGE = "gauge"
+SUMMARY = "summary"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+METRICS = {
+    "pga_messages_sent_total": (COUNTER, "Messages published to the broker."),
+    "pga_messages_received_total": (COUNTER, "Messages with evaluated individuals received from the broker."),
+    "pga_bytes_sent_total": (COUNTER, "Message body bytes published to the broker."),
+    "pga_bytes_received_total": (COUNTER, "Message body bytes received from the broker."),
+    "pga_individuals_received_total": (COUNTER, "Evaluated individuals received."),
+    "pga_duplicate_evaluations_total": (COUNTER, "Received individuals whose solution had been evaluated before."),
+    "pga_late_individuals_total": (COUNTER, "Individuals received after their generation was closed."),
+    "pga_cropped_individuals_total": (COUNTER, "Surplus individuals cropped from oversized generations."),
+    "pga_underfilled_generations_total": (COUNTER, "Generations closed with fewer individuals than wanted."),
+    "pga_generations_total": (COUNTER, "Completed generations."),
+    "pga_coalesced_snapshots_total": (COUNTER, "Population snapshots superseded before being persisted."),
+    "pga_fitness_best": (GAUGE, "Best fitness of the current population."),
+    "pga_fitness_mean": (GAUGE, "Mean fitness of the current population."),
+    "pga_fitness_stdev": (GAUGE, "Standard deviation of the fitness of the current population."),
+    "pga_fitness_worst": (GAUGE, "Worst fitness of the current population."),
+    "pga_phase_seconds": (SUMMARY, "Time spent per phase of the generation loop."),
+}
+
+__VALUES = {}
+__LOCK = threading.Lock()
+
+
+def __labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def inc(name, pga_id, value=1, **labels):
+    key = (name, __labels_key(dict(labels, pga_id=pga_id)))
+    with __LOCK:
+        __VALUES[key] = __VALUES.get(key, 0) + value
+
+
+def set_gauge(name, pga_id, value, **labels):
+    key = (name, __labels_key(dict(labels, pga_id=pga_id)))
+    with __LOCK:
+        __VALUES[key] = value
+
+
+def observe(name, pga_id, seconds, **labels):
+    key = (name, __labels_key(dict(labels, pga_id=pga_id)))
+    with __LOCK:
+        count, total = __VALUES.get(key, (0, 0.0))
+        __VALUES[key] = (count + 1, total + seconds)
+
+
+@contextmanager
+def span(pga_id, phase):
+    # Times a phase of the generation loop.
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("pga_phase_seconds", pga_id, time.perf_counter() - start, phase=phase)
+
+
+def get_phase_seconds(pga_id):
+    # Count and total seconds of each timed phase of one PGA.
+    pga_labels = ("pga_id", pga_id)
+    with __LOCK:
+        return {dict(labels)["phase"]: value for (metric, labels), value in __VALUES.items()
+                if metric == "pga_phase_seconds" and pga_labels in labels}
+
+
+def set_fitness_stats(pga_id, stats):
+    for stat in ["best", "mean", "stdev", "worst"]:
+        if stats.get(stat) is not None:
+            set_gauge("pga_fitness_{stat_}".format(stat_=stat), pga_id, stats[stat])
+
+
+def render():
+    with __LOCK:
+        values = dict(__VALUES)
+
+    lines = []
+    for name, (metric_type, description) in METRICS.items():
+        samples = sorted((labels, value) for (metric, labels), value in values.items() if metric == name)
+        if not samples:
+            continue
+        lines.append("# HELP {name_} {desc_}".format(name_=name, desc_=description))
+        lines.append("# TYPE {name_} {type_}".format(name_=name, type_=metric_type))
+        for labels, value in samples:
+            label_text = ",".join('{key_}="{val_}"'.format(key_=key, val_=val) for key, val in labels)
+            if metric_type == SUMMARY:
+                count, total = value
+                lines.append("{name_}_count{{{labels_}}} {val_}".format(name_=name, labels_=label_text, val_=count))
+                lines.append("{name_}_sum{{{labels_}}} {val_}".format(name_=name, labels_=label_text, val_=total))
+            else:
+                lines.append("{name_}{{{labels_}}} {val_}".format(name_=name, labels_=label_text, val_=value))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,44 @@
+# Native types of the PGA properties, used to parse values that come back from the database as bytes.
+PROPERTY_TYPES = {
+    "POPULATION_SIZE": int,
+    "ELITISM_RATE": float,
+    "RECEIVE_PREFETCH": int,
+    "MESSAGE_CODEC": str,
+    "MESSAGE_COMPRESSION": str,
+    "RELEASE_SHARDS": int,
+    "RELEASE_SHARD_BYTES": int,
+    "MAX_GENERATIONS": int,
+    "MAX_UNIMPROVED_GENERATIONS": int,
+    "MAX_TIME_SECONDS": float,
+    "WRITE_BEHIND": bool,
+    "RECORD_HISTORY": bool,
+    "ADAPTIVE_POPULATION": bool,
+    "FITNESS_CACHE_SHARED": bool,
+    "STAGES_PASS_HEADERS": bool,
+}
+
+_TRUE_VALUES = ["1", "true", "yes", "on"]
+
+
+def parse_property(property_key, raw_value):
+    # Parses a stored property value once into its native type, unknown properties are kept as text.
+    if raw_value is None:
+        return None
+    if isinstance(raw_value, bytes):
+        raw_value = raw_value.decode("utf-8")
+    property_type = PROPERTY_TYPES.get(property_key, str)
+    if property_type is bool:
+        return str(raw_value).lower() in _TRUE_VALUES
+    if property_type is int:
+        return int(float(raw_value))
+    return property_type(raw_value)
+
+
+def parse_properties(raw_properties):
+    return {key: parse_property(key, value) for key, value in raw_properties.items()}
+
+
+def get_flag(properties, property_key, default=False):
+    # Boolean properties may be given natively or as text, e.g. "yes" or "0".
+    value = properties.get(property_key)
+    return default if value is None else parse_property(property_key, value)
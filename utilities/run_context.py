@@ -0,0 +1,37 @@
+import threading
+
+from population.population import PopulationBuffer
+
+
+class RunContext(object):
+    # Isolated state of one PGA driven by this runner: container config, properties, receive buffer and fitness cache.
+    def __init__(self, pga_id):
+        self.pga_id = pga_id
+        self.container_conf = None
+        self.properties = {}
+        self.evaluated_individuals = PopulationBuffer()
+        self.fitness_cache = None
+        self.lock = threading.Lock()
+
+    def reset(self):
+        # Forgets the state of a previous run, the container config and known fitness values stay valid.
+        with self.lock:
+            self.properties = {}
+            self.evaluated_individuals = PopulationBuffer()
+
+
+__CONTEXTS = {}
+__CONTEXTS_LOCK = threading.Lock()
+
+
+def get_run_context(pga_id):
+    with __CONTEXTS_LOCK:
+        context = __CONTEXTS.get(pga_id)
+        if context is None:
+            context = RunContext(pga_id)
+            __CONTEXTS[pga_id] = context
+        return context
+
+
+def reset_run_context(pga_id):
+    get_run_context(pga_id).reset()
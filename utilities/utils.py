@@ -1,14 +1,26 @@
 import logging
-import operator
 import os
-from re import match
+import threading
 
 import yaml
 
+from population.population import Population, PopulationBuffer
+from utilities.properties import parse_properties
+from utilities.run_context import get_run_context
+
 PGA_NAME_SEPARATOR = "--"
-__CONTAINER_CONF = None
-__PROPERTIES = {}
-__EVALUATED_INDIVIDUALS = []
+LOG_SAMPLE_RATE = 1000
+__YAML_CACHE = {}
+__YAML_CACHE_LOCK = threading.Lock()
+__LOG_SAMPLES = {}
+
+
+# Logging command
+def is_log_sampled(sample_key, rate=LOG_SAMPLE_RATE):
+    # True for every rate-th call per key, so per-individual logs only show samples.
+    count = __LOG_SAMPLES.get(sample_key, 0)
+    __LOG_SAMPLES[sample_key] = count + 1
+    return count % rate == 0
 
 
 # YAML command
@@ -18,80 +30,127 @@ def parse_yaml(yaml_file_path):
     return content
 
 
+def parse_yaml_cached(yaml_file_path):
+    # Parses a YAML file only again after it has been modified. The returned content is shared, do not modify it.
+    modified = os.stat(yaml_file_path).st_mtime_ns
+    with __YAML_CACHE_LOCK:
+        cached = __YAML_CACHE.get(yaml_file_path)
+    if cached is not None and cached[0] == modified:
+        return cached[1]
+
+    content = parse_yaml(yaml_file_path)
+    with __YAML_CACHE_LOCK:
+        __YAML_CACHE[yaml_file_path] = (modified, content)
+    return content
+
+
+def get_pga_config(pga_id):
+    return parse_yaml_cached("/{id_}{sep_}config.yml".format(
+        id_=pga_id,
+        sep_=PGA_NAME_SEPARATOR,
+    ))
+
+
 # Commands for population and individuals
-def collect_and_reset_received_individuals():
-    global __EVALUATED_INDIVIDUALS
-    received = sort_population_by_fitness(__EVALUATED_INDIVIDUALS)
-    __EVALUATED_INDIVIDUALS = []
-    return received
+def collect_and_reset_received_individuals(pga_id):
+    context = get_run_context(pga_id)
+    with context.lock:
+        received = context.evaluated_individuals
+        context.evaluated_individuals = PopulationBuffer()
+    return received.to_population().sorted()
 
 
-def save_received_individual(individual):
-    global __EVALUATED_INDIVIDUALS
-    __EVALUATED_INDIVIDUALS.append(individual)
-    current_length = __EVALUATED_INDIVIDUALS.__len__()
-    return current_length >= int(get_property("POPULATION_SIZE")), current_length
+def save_received_individuals(pga_id, individuals, expected_amount):
+    # expected_amount is resolved once per generation by the caller instead of per received message.
+    context = get_run_context(pga_id)
+    with context.lock:
+        context.evaluated_individuals.extend(individuals)
+        current_length = context.evaluated_individuals.__len__()
+    return current_length >= expected_amount, current_length
+
+
+def count_received_individuals(pga_id):
+    context = get_run_context(pga_id)
+    with context.lock:
+        return context.evaluated_individuals.__len__()
+
+
+def truncate_received_individuals(pga_id, amount):
+    # Forgets the individuals received after the first amount ones, e.g. those the broker is about to redeliver.
+    context = get_run_context(pga_id)
+    with context.lock:
+        context.evaluated_individuals.truncate(amount)
+
+
+def set_random_state(rng, random_state):
+    # Restores a random state that went through JSON, which turns its tuples into lists.
+    if random_state is not None:
+        version, internal_state, gauss_next = random_state
+        rng.setstate((version, tuple(internal_state), gauss_next))
 
 
 def sort_population_by_fitness(population):
     # Sorts and returns population by fitness, in descending order (fittest first).
-    return sorted(population, key=operator.attrgetter("fitness"), reverse=True)
+    if not isinstance(population, Population):
+        population = Population(population)
+    return population.sorted()
 
 
 # Commands for properties
-def get_messaging_source():
-    if not __CONTAINER_CONF:
-        __retrieve_container_config()
-    return __CONTAINER_CONF["source"]
-
+def get_messaging_source(pga_id):
+    return __get_container_config(pga_id)["source"]
 
-def get_messaging_init_gen():
-    if not __CONTAINER_CONF:
-        __retrieve_container_config()
-    return __CONTAINER_CONF["init_gen"]
 
+def get_messaging_init_gen(pga_id):
+    return __get_container_config(pga_id)["init_gen"]
 
-def get_messaging_init_eval():
-    if not __CONTAINER_CONF:
-        __retrieve_container_config()
-    return __CONTAINER_CONF["init_eval"]
 
+def get_messaging_init_eval(pga_id):
+    return __get_container_config(pga_id)["init_eval"]
 
-def get_messaging_pga():
-    if not __CONTAINER_CONF:
-        __retrieve_container_config()
-    return __CONTAINER_CONF["pga"]
 
+def get_messaging_pga(pga_id):
+    return __get_container_config(pga_id)["pga"]
 
-def get_pga_id():
-    if not __CONTAINER_CONF:
-        __retrieve_container_config()
-    return __CONTAINER_CONF["pga_id"]
 
+def __get_container_config(pga_id):
+    context = get_run_context(pga_id)
+    if not context.container_conf:
+        context.container_conf = __retrieve_container_config(pga_id)
+    return context.container_conf
 
-def __retrieve_container_config():
-    # Retrieve locally saved config file.
-    files = [f for f in os.listdir("/") if match(r'[0-9]+--runner-config\.yml', f)]
-    # https://stackoverflow.com/questions/2225564/get-a-filtered-list-of-files-in-a-directory/2225927#2225927
-    # https://regex101.com/
 
-    if not files.__len__() > 0:
-        raise Exception("Error retrieving the container config: No matching config file found!")
-    config = parse_yaml("/{}".format(files[0]))
-    global __CONTAINER_CONF
-    __CONTAINER_CONF = {
+def __retrieve_container_config(pga_id):
+    # Retrieve the locally saved config file of the given PGA.
+    config_path = "/{id_}{sep_}runner-config.yml".format(
+        id_=pga_id,
+        sep_=PGA_NAME_SEPARATOR,
+    )
+    if not os.path.isfile(config_path):
+        raise Exception("Error retrieving the container config: No config file found for PGA {id_}!".format(
+            id_=pga_id,
+        ))
+    config = parse_yaml(config_path)
+    container_conf = {
         "pga_id": config.get("pga_id"),
         "source": config.get("source"),
         "init_gen": config.get("init_gen"),
         "init_eval": config.get("init_eval"),
         "pga": config.get("pga")
     }
-    logging.info("Container config retrieved: {conf_}".format(conf_=__CONTAINER_CONF))
+    logging.info("Container config retrieved: {conf_}".format(conf_=container_conf))
+    return container_conf
+
+
+def get_property(pga_id, property_key, default=None):
+    value = get_run_context(pga_id).properties.get(property_key)
+    return default if value is None else value
 
 
-def get_property(property_key):
-    return __PROPERTIES[property_key]
+def set_property(pga_id, property_key, property_value):
+    get_run_context(pga_id).properties[property_key] = property_value
 
 
-def set_property(property_key, property_value):
-    __PROPERTIES[property_key] = property_value
+def set_properties(pga_id, raw_properties):
+    # Parses raw property values once into their native types for the generation loop.
+    get_run_context(pga_id).properties.update(parse_properties(raw_properties))